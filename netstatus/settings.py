@@ -128,3 +128,122 @@ STATIC_URL = '/static/'
 SNMP_COMMUNITY_R = ""
 
 SNMP_COMMUNITY_RW = ""
+
+# How often (in seconds) the poll_devices management command checks whether every device is online or offline.
+POLL_INTERVAL = 60
+
+# Maximum number of devices that are 'pinged' at the same time when checking whether devices are online.
+PING_CONCURRENCY = 32
+
+# The core switch has the MAC address of every device on the network on almost every port, so it is never used when
+# searching for devices.
+CORE_SWITCH_IPV4 = "10.49.84.1"
+
+# Maximum number of devices SNMP tables (eg. MAC address tables) are collected from at the same time, and how long (in
+# seconds) collecting from a single device can take before it is given up on.
+SNMP_COLLECT_CONCURRENCY = 16
+SNMP_COLLECT_TIMEOUT = 60
+
+# Default number of table rows asked for in each SNMP GETBULK request, for devices without their own setting.
+SNMP_MAX_REPETITIONS = 25
+
+# How long (in seconds) the MAC address -> port and ignored (uplink/downlink) port results of a device are cached for
+# before they are collected from the device again. Ignored ports rarely change, so these are kept for a week.
+MAC_TO_PORT_MAX_AGE = 86400
+IGNORED_PORT_MAX_AGE = 604800
+
+# Routers whose ARP tables are harvested (by the poll_devices management command) to find the MAC address of a device
+# from its IPv4 address, how often this is done, and how long (in seconds) a harvested entry is trusted for.
+ARP_ROUTERS = [CORE_SWITCH_IPV4]
+ARP_HARVEST_INTERVAL = 300
+ARP_CACHE_MAX_AGE = 900
+
+# Maximum number of idle SNMP sessions kept open for reuse, and how long (in seconds) an unused session is kept open.
+SNMP_POOL_MAX_SIZE = 64
+SNMP_POOL_MAX_IDLE = 300
+
+# A device that fails to answer SNMP requests this many times in a row is skipped, rather than waited on, for
+# SNMP_BACKOFF_BASE seconds. This doubles with every further failure, up to SNMP_BACKOFF_MAX seconds, with a single
+# request let through each time the backoff is up to check whether the device has come back.
+SNMP_FAILURE_THRESHOLD = 3
+SNMP_BACKOFF_BASE = 30
+SNMP_BACKOFF_MAX = 900
+
+# SNMP timeouts and retries are worked out for every device from how quickly it answers. These are the timeout (in
+# seconds) and retries used for a device that hasn't been timed yet, the shortest and longest timeout ever used, and
+# roughly how long (in seconds) a single request to a device can take including its retries.
+SNMP_TIMEOUT_INITIAL = 1.0
+SNMP_RETRIES_INITIAL = 2
+SNMP_TIMEOUT_MIN = 0.2
+SNMP_TIMEOUT_MAX = 5.0
+SNMP_REQUEST_BUDGET = 3.0
+
+# How long (in seconds) the information on a device's information page is cached for before it is got from the device
+# again, and for how much longer after that the cached information is still shown while it is updated in the
+# background.
+DEVICE_INFO_CACHE_TTL = 60
+DEVICE_INFO_MAX_STALE = 900
+
+# Number of stored log entries shown on each page of a device's information page.
+LOG_ENTRIES_PER_PAGE = 50
+
+# Only one refresh of the search results runs at a time, across every process. How long (in seconds) a search waits
+# for a refresh started by another search before using the previous results, and how long (in seconds) a refresh can
+# go without finishing with a device before it is assumed to have been abandoned (eg. the process running it was
+# killed). This has to be longer than SNMP_COLLECT_TIMEOUT plus the time taken to ping the devices first.
+REFRESH_LOCK_WAIT = 60
+REFRESH_LOCK_LEASE = 600
+
+# Number of searches that are run in the background at the same time by each process, and how long (in seconds) a
+# finished search is kept so its result can be looked at.
+SEARCH_WORKERS = 4
+SEARCH_JOB_MAX_AGE = 86400
+# How long (in seconds) a search can go without making progress before it is assumed to have been lost (eg. the
+# process running it was restarted), and shown as failed. This has to be longer than a search can spend waiting for
+# the refreshes run by other searches (twice REFRESH_LOCK_WAIT) plus SNMP_COLLECT_TIMEOUT.
+SEARCH_JOB_TIMEOUT = 600
+
+# Most addresses that can be searched for in a single request to the batch search API (/api/search).
+SEARCH_BATCH_MAX_SIZE = 1000
+
+# Number of rows got from the database at a time when exporting tables (/export/...).
+EXPORT_CHUNK_SIZE = 2000
+
+# Interface traffic counters are stored in a fixed size file for every device in TIMESERIES_DIR, with room for
+# TIMESERIES_SLOTS samples (the oldest being replaced once it is full) of up to TIMESERIES_PORTS ports. The poller
+# takes a sample every TIMESERIES_INTERVAL seconds, so the defaults keep a week of history at 5 minute intervals.
+# Only physical ports are recorded (not VLAN interfaces or port-channels), so 128 ports is enough for a stack of two
+# 48 port switches with uplinks; raise it for larger stacks before the stores are created, as they keep their size.
+# Recording the counters needs NumPy; set TIMESERIES_INTERVAL to 0 to turn it off.
+TIMESERIES_DIR = os.path.join(BASE_DIR, 'timeseries')
+TIMESERIES_SLOTS = 2016
+TIMESERIES_PORTS = 128
+TIMESERIES_INTERVAL = 300
+
+# The counters are also rolled up into the minimum, average, maximum and 95th percentile rate of every counter over
+# buckets of each of these sizes, as (name, seconds per bucket, number of buckets kept), for charts over long periods.
+TIMESERIES_ROLLUPS = (
+    ('5min', 300, 2016),  # A week
+    ('hour', 3600, 744),  # A month
+    ('day', 86400, 366),  # A year
+)
+
+# Devices going online and offline are streamed to the device map (/device/status). Each web process checks for new
+# changes every STATUS_EVENT_POLL_INTERVAL seconds, however many maps are open, and keeps the last STATUS_EVENT_BACKLOG
+# of them for maps that reconnect. Changes are kept in the database for STATUS_EVENT_MAX_AGE seconds.
+STATUS_EVENT_POLL_INTERVAL = 1
+STATUS_EVENT_BACKLOG = 1000
+STATUS_EVENT_MAX_AGE = 86400
+# A comment is sent to each open map every STATUS_STREAM_KEEPALIVE seconds so proxies don't close the connection, and
+# each connection is ended after STATUS_STREAM_DURATION seconds (the browser reconnects straight away, carrying on
+# where it left off), so a map left open doesn't tie up a web server thread forever.
+STATUS_STREAM_KEEPALIVE = 15
+STATUS_STREAM_DURATION = 300
+
+# The trap_receiver management command listens for SNMP traps and informs on this UDP port, only accepting those sent
+# with SNMP_TRAP_COMMUNITY, which must be set (and shouldn't be the same as the read community) for it to start.
+SNMP_TRAP_PORT = 162
+SNMP_TRAP_COMMUNITY = ""
+# A notification normally counts for the device it was sent from. Only those passed on by these trap forwarders (and
+# by this server, eg. send_test_trap) may name another device as the one they came from.
+SNMP_TRAP_PROXIES = ()
@@ -22,13 +22,19 @@ urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^$', views.main, name='main'),
     url(r'^device/list$', views.device_list, name='device-list'),
+    url(r'^device/status$', views.device_status, name='device-status'),
     url(r'^device/new$', views.device_new, name='new-device'),
     url(r'^device/new/success$', views.device_new_success, name='new-device-success'),
     url(r'^device/remove$', views.device_remove, name='remove-device'),
     url(r'^device/info/(?P<id>[0-9]+)/$', views.device_info, name='device-info'),
+    url(r'^device/info/(?P<id>[0-9]+)/traffic/(?P<port>[0-9]+)\.svg$', views.device_traffic, name='device-traffic'),
     url(r'^device/edit/db/(?P<id>[0-9]+)/$', views.device_edit_db, name='device-edit-db'),
     url(r'^device/edit/snmp/(?P<id>[0-9]+)/$', views.device_edit_snmp, name='device-edit-snmp'),
     url(r'^device/edit/success/$', views.device_edit_success, name='device-edit-success'),
     url(r'^piechart-online$', views.piechart_online, name='piechart-online'),
-    url(r'^search$', views.search, name='search')
+    url(r'^search$', views.search, name='search'),
+    url(r'^search/(?P<id>[0-9a-f-]+)$', views.search_job, name='search-job'),
+    url(r'^search/(?P<id>[0-9a-f-]+)/progress$', views.search_progress, name='search-progress'),
+    url(r'^api/search$', views.search_batch, name='search-batch'),
+    url(r'^export/(?P<table>mac-to-port|ignored-ports|devices)\.(?P<format>csv|ndjson)$', views.export, name='export')
 ]
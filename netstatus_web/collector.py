@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from netstatus.settings import SNMP_COLLECT_CONCURRENCY, SNMP_COLLECT_TIMEOUT
+
+
+def collect(devices, fetch, concurrency=SNMP_COLLECT_CONCURRENCY, timeout=SNMP_COLLECT_TIMEOUT, done=None):
+    """
+    Calls fetch(device) for every device in the list at the same time, and returns a tuple of two dictionaries:
+    device -> whatever fetch returned, and device -> the exception raised for every device that failed.
+
+    EasySNMP sessions block, so each fetch runs in a thread while an asyncio event loop schedules them. No more than
+    'concurrency' devices are contacted at once, and a device that takes longer than 'timeout' seconds is given up on
+    (with an asyncio.TimeoutError), so the whole collection takes about as long as the slowest device rather than the
+    total of all of them. A device given up on still holds its thread until its SNMP session times out, and the time
+    another device spends waiting for that thread counts towards its own timeout.
+
+    fetch must not use the database, as it is run outside of the thread that called collect.
+
+    If done is given, done(device, result, error) is called as soon as each device has finished, with error set to
+    the exception if it failed (and result None). Unlike fetch, this is called in the thread that called collect, so
+    it can use the database, eg. to store each device's results without waiting for the slowest device.
+    """
+    devices = list(devices)
+
+    if not devices:
+        return {}, {}
+
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(devices)))
+
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(_collect(loop, executor, devices, fetch, concurrency, timeout, done))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        # Don't wait for threads stuck on a device that already timed out, they will finish on their own once the
+        # SNMP session itself times out.
+        executor.shutdown(wait=False)
+
+
+async def _collect(loop, executor, devices, fetch, concurrency, timeout, done):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    failed = {}
+
+    async def fetch_device(device):
+        async with semaphore:
+            try:
+                # The timeout starts once the device has a slot, not while it waits for one. It does include any time
+                # spent waiting for a free thread though: wait_for can only stop waiting for a device that timed out,
+                # not stop the thread contacting it, so until that thread's SNMP session times out too it isn't
+                # available to the devices after it.
+                results[device] = await asyncio.wait_for(loop.run_in_executor(executor, fetch, device), timeout)
+            except Exception as error:
+                failed[device] = error
+
+        if done is not None:
+            done(device, results.get(device), failed.get(device))
+
+    await asyncio.gather(*[fetch_device(device) for device in devices])
+
+    return results, failed
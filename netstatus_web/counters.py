@@ -0,0 +1,75 @@
+import time
+
+from .collector import collect
+from .rollups import update_rollups
+from .timeseries import COUNTERS, open_store
+from .utils import device_session, bulk_walk
+from .walks import parse_counter_walk
+
+# Recording interface counters needs NumPy (see timeseries.py), so it is kept out of utils.py, which every page and
+# command imports, and only imported by the poller when counters are being recorded.
+
+# OIDs of the interface counters stored for every port, in the order of timeseries.COUNTERS: ifHCInOctets and
+# ifHCOutOctets (64-bit, so they don't wrap every few minutes on a busy gigabit port), then ifInErrors, ifOutErrors,
+# ifInDiscards and ifOutDiscards.
+COUNTER_OIDS = ('1.3.6.1.2.1.31.1.1.1.6', '1.3.6.1.2.1.31.1.1.1.10', '1.3.6.1.2.1.2.2.1.14', '1.3.6.1.2.1.2.2.1.20',
+                '1.3.6.1.2.1.2.2.1.13', '1.3.6.1.2.1.2.2.1.19')
+
+# ifType, and the types of physical ports: ethernetCsmacd, fastEther, fastEtherFX and gigabitEthernet. VLAN interfaces
+# (propVirtual), port-channels (ieee8023adLag), loopbacks and so on aren't recorded, so that they don't use up the
+# columns of a store before the ports of every member of a stack have been given one.
+IF_TYPE = '1.3.6.1.2.1.2.2.1.3'
+PHYSICAL_IF_TYPES = (6, 62, 69, 117)
+
+
+def record_interface_counters(device_list):
+    """
+    Gets the traffic, error and discard counters of every port of every device in the list at the same time, and
+    appends them to each device's counter store (see timeseries.py), bringing its rollups (see rollups.py) up to date.
+    Only physical ports are recorded (see PHYSICAL_IF_TYPES). Returns (the number of devices recorded, a dictionary of
+    device -> the error raised storing its sample or rollups, and a dictionary of device -> the ifIndexes of the ports
+    that didn't fit in its store).
+
+    Devices that can't be contacted are left out of this sample. A device whose sample can't be stored (eg. because
+    TIMESERIES_DIR is full or read only, or its store is damaged) doesn't stop the others being stored.
+    """
+    def fetch(device):
+        counters = {}
+
+        with device_session(device) as session:
+            physical = set(ifindex for ifindex, if_type in
+                           parse_counter_walk(bulk_walk(session, IF_TYPE, device.snmp_max_repetitions)).items()
+                           if if_type in PHYSICAL_IF_TYPES)
+
+            for n, oid in enumerate(COUNTER_OIDS):
+                for ifindex, value in parse_counter_walk(bulk_walk(session, oid, device.snmp_max_repetitions)).items():
+                    # A device that doesn't report the ifType of its ports has all of them recorded
+                    if ifindex in physical or not physical:
+                        counters.setdefault(ifindex, [None] * len(COUNTERS))[n] = value
+
+        return counters
+
+    samples, failed = collect(device_list, fetch)
+    now = int(time.time())
+
+    # The stores are only written to here, in the thread that called this, so only one sample is ever being appended
+    # to a store at a time
+    recorded = 0
+    errors = {}
+    dropped = {}
+
+    for device, counters in samples.items():
+        try:
+            store = open_store(device.id)
+            left_out = store.append(now, counters)
+            store.flush()
+            recorded += 1
+
+            if left_out:
+                dropped[device] = left_out
+
+            update_rollups(device.id, store)
+        except Exception as error:
+            errors[device] = error
+
+    return recorded, errors, dropped
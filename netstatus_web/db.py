@@ -0,0 +1,36 @@
+from django.db import connection
+from django.db.models import Case, Value, When
+
+# Queries with a parameter for every row (eg. filtering on a list of IDs, or a CASE with a WHEN for every row) are made
+# for this many rows at a time. SQLite allows no more than 999 parameters in a query, which this leaves room under
+# even with a CASE for each of several fields.
+BATCH_SIZE = 100
+
+
+def batches(items, size=BATCH_SIZE):
+    """
+    Splits a list into lists of up to size items, each small enough to be used in a single query.
+    """
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def update_each(queryset, values, output_fields):
+    """
+    Sets fields of each row in values, a list of (ID, dictionary of field name -> value), to that row's own values.
+    output_fields is a dictionary of the name of every field set -> a model field of its type.
+
+    Rather than saving the rows one at a time, each batch of rows is written with a single UPDATE using a CASE for each
+    field.
+    """
+    for batch in batches(values):
+        queryset.filter(id__in=[id for id, fields in batch]).update(**dict(
+            (name, Case(*[When(id=id, then=Value(fields[name])) for id, fields in batch], output_field=output_field))
+            for name, output_field in output_fields.items()))
+
+
+def close_thread_connection():
+    """
+    Closes the database connection of a thread that isn't part of a request, eg. one running work in the background.
+    Django only closes the connections of threads handling requests, so otherwise it would be left open.
+    """
+    connection.close()
@@ -0,0 +1,155 @@
+import collections
+import json
+import threading
+import time
+
+from django.db import connection
+
+from .models import StatusEvent
+
+from netstatus.settings import STATUS_EVENT_POLL_INTERVAL, STATUS_EVENT_BACKLOG, STATUS_STREAM_KEEPALIVE, \
+    STATUS_STREAM_DURATION
+
+
+class StatusBroadcaster(object):
+    """
+    Passes the devices going online and offline recorded by the poller (as StatusEvents) on to every device map open in
+    this process.
+
+    A single thread checks the database for new events every STATUS_EVENT_POLL_INTERVAL seconds and keeps the most
+    recent ones in memory, waking every map waiting for them. So each process makes the same single query however
+    many maps are open. The thread is only started once a map is first opened.
+
+    Events from before the thread was started, or that are no longer kept in memory, are got from the database
+    instead, as long as they are still stored there (see STATUS_EVENT_MAX_AGE).
+    """
+
+    def __init__(self, interval=STATUS_EVENT_POLL_INTERVAL, backlog=STATUS_EVENT_BACKLOG):
+        self.interval = interval
+
+        self._condition = threading.Condition()
+        self._thread = None
+        # (ID, JSON) of the most recent events, oldest first
+        self._events = collections.deque(maxlen=backlog)
+        # Every event with an ID greater than this is in _events
+        self._floor = None
+        self._last_id = None
+
+    def _start(self):
+        with self._condition:
+            if self._thread is None:
+                self._floor = self._last_id = self._latest_id()
+
+                self._thread = threading.Thread(target=self._run, name='status-broadcaster', daemon=True)
+                self._thread.start()
+
+    @staticmethod
+    def _latest_id():
+        latest = StatusEvent.objects.order_by('-id').values_list('id', flat=True).first()
+
+        return latest or 0
+
+    @staticmethod
+    def _event(event):
+        return event.id, json.dumps({'id': event.device_id, 'online': event.online, 'time': event.time})
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                events = list(StatusEvent.objects.filter(id__gt=self._last_id).order_by('id')[:STATUS_EVENT_BACKLOG])
+            except Exception:
+                # Eg. the database was briefly unavailable; try again with a new connection next time
+                connection.close()
+                continue
+
+            if not events:
+                continue
+
+            with self._condition:
+                for event in events:
+                    if len(self._events) == self._events.maxlen:
+                        self._floor = self._events[0][0]
+
+                    self._events.append(self._event(event))
+
+                self._last_id = events[-1].id
+                self._condition.notify_all()
+
+    def latest(self):
+        """
+        Returns the ID of the newest event seen, starting the thread that checks for new events if needed.
+        """
+        self._start()
+
+        return self._last_id
+
+    def wait(self, after, timeout):
+        """
+        Waits up to timeout seconds for events newer than the event with the ID after. Returns (events, missed), where
+        events is a list of the (ID, JSON) of every newer event and missed is True if some of them are no longer stored
+        (eg. a map reconnecting after a long time).
+        """
+        self._start()
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > after, timeout)
+
+            events = [event for event in self._events if event[0] > after]
+            floor = self._floor
+
+        if after >= floor:
+            return events, False
+
+        # Some of the events aren't kept in memory, eg. for a map that was connected to another process. They are
+        # still in the database, unless they are older than STATUS_EVENT_MAX_AGE. Events are deleted oldest first, so
+        # if the last event the map got is still stored, so are all of the events since.
+        if not StatusEvent.objects.filter(id=after).exists():
+            return [], True
+
+        stored = StatusEvent.objects.filter(id__gt=after, id__lte=floor).order_by('id')
+
+        return [self._event(event) for event in stored] + events, False
+
+
+status_broadcaster = StatusBroadcaster()
+
+
+def status_stream(last_event_id=None, duration=STATUS_STREAM_DURATION):
+    """
+    Yields the devices going online and offline as Server-Sent Events, each with the event ID and data of a JSON object
+    with the device ID, whether it is now online and the Unix timestamp of the change. Carries on from the event with
+    the ID last_event_id if given (as sent by a reconnecting browser), otherwise from now.
+
+    If events have been missed, a 'reset' event is sent so the map can be reloaded. Ends after duration seconds.
+    """
+    ends = time.time() + duration
+
+    # Browsers reconnect this many milliseconds after the stream ends
+    yield "retry: 1000\n\n"
+
+    if last_event_id is None:
+        last_event_id = status_broadcaster.latest()
+
+        # Sent straight away, so a browser that reconnects before any event has been sent carries on from here rather
+        # than missing the changes made while it was reconnecting
+        yield "id: {0}\n\n".format(last_event_id)
+
+    while time.time() < ends:
+        events, missed = status_broadcaster.wait(last_event_id, min(STATUS_STREAM_KEEPALIVE, ends - time.time()))
+
+        if missed:
+            # The map is reloaded, getting the current state of every device, so the events don't need to be sent
+            yield "event: reset\ndata: {}\n\n"
+            last_event_id = status_broadcaster.latest()
+            continue
+
+        if not events:
+            yield ": keepalive\n\n"
+            continue
+
+        for event_id, data in events:
+            yield "id: {0}\ndata: {1}\n\n".format(event_id, data)
+
+        last_event_id = events[-1][0]
@@ -0,0 +1,88 @@
+import csv
+import json
+
+from .models import Device, MACtoPort, IgnoredPort
+from .macaddr import int_to_mac
+
+from netstatus.settings import EXPORT_CHUNK_SIZE
+
+# Table name -> (function returning the rows to export, fields got from the database, column names, and functions that
+# convert the value of a column for output). The first field is always the primary key, which rows are ordered and
+# resumed by.
+EXPORTS = {
+    'mac-to-port': (lambda: MACtoPort.objects.current(),
+                    ('id', 'device_id', 'device__name', 'device__ipv4_address', 'mac_address', 'port'),
+                    ('id', 'device_id', 'device_name', 'device_ipv4_address', 'mac_address', 'port'),
+                    {'mac_address': int_to_mac}),
+    'ignored-ports': (lambda: IgnoredPort.objects.all(),
+                      ('id', 'device_id', 'device__name', 'device__ipv4_address', 'port'),
+                      ('id', 'device_id', 'device_name', 'device_ipv4_address', 'port'),
+                      {}),
+    'devices': (lambda: Device.objects.all(),
+                ('id', 'name', 'ipv4_address', 'online', 'location_x', 'location_y', 'system_version',
+                 'mac_to_port_updated', 'ignored_port_updated'),
+                ('id', 'name', 'ipv4_address', 'online', 'location_x', 'location_y', 'system_version',
+                 'mac_to_port_updated', 'ignored_port_updated'),
+                {'location_x': lambda value: format(value.normalize(), 'f'),
+                 'location_y': lambda value: format(value.normalize(), 'f')}),
+}
+
+
+def export_rows(table, after=0, limit=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields every row of an export (see EXPORTS) with a primary key greater than after, in primary key order, as a
+    tuple of column values ready for output. Stops after limit rows if limit is given.
+
+    Rather than loading the whole table, the rows are got chunk_size at a time, each chunk with its own query that
+    carries on from the last primary key of the one before (keyset pagination). So memory use doesn't depend on how
+    many rows there are, and an export that was cut short can be carried on from the last primary key it got.
+    """
+    rows, fields, columns, converters = EXPORTS[table]
+    convert = [converters.get(column) for column in columns]
+
+    while limit is None or limit > 0:
+        size = chunk_size if limit is None else min(chunk_size, limit)
+
+        chunk = list(rows().filter(pk__gt=after).order_by('pk').values_list(*fields)[:size])
+
+        for row in chunk:
+            yield tuple(value if function is None or value is None else function(value)
+                        for function, value in zip(convert, row))
+
+        if len(chunk) < size:
+            return
+
+        after = chunk[-1][0]
+
+        if limit is not None:
+            limit -= len(chunk)
+
+
+class Echo(object):
+    """
+    Stands in for a file for csv.writer, returning each line it is given rather than storing it.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(table, rows):
+    """
+    Yields an export as lines of CSV, starting with a line of column names.
+    """
+    writer = csv.writer(Echo())
+
+    yield writer.writerow(EXPORTS[table][2])
+
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(table, rows):
+    """
+    Yields an export as lines of NDJSON, with a JSON object of column name -> value for each row.
+    """
+    columns = EXPORTS[table][2]
+
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + "\n"
@@ -14,11 +14,12 @@ class EditDeviceForm(forms.ModelForm):
 
         model = Device
 
-        fields = ('name', 'ipv4_address', 'location_x', 'location_y')
+        fields = ('name', 'ipv4_address', 'location_x', 'location_y', 'snmp_max_repetitions')
 
         widgets = {'location_x': forms.HiddenInput(), 'location_y': forms.HiddenInput()}
 
-        labels = {'name': 'Device Name', 'ipv4_address': 'Device IPv4 Address'}
+        labels = {'name': 'Device Name', 'ipv4_address': 'Device IPv4 Address',
+                  'snmp_max_repetitions': 'SNMP GETBULK max-repetitions (0 to disable GETBULK)'}
 
 
 class RemoveDeviceForm(forms.Form):
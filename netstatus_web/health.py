@@ -0,0 +1,87 @@
+import threading
+import time
+
+from easysnmp import exceptions
+
+from netstatus.settings import SNMP_FAILURE_THRESHOLD, SNMP_BACKOFF_BASE, SNMP_BACKOFF_MAX
+
+
+class DeviceBackoffError(exceptions.EasySNMPTimeoutError):
+    """
+    Raised instead of contacting a device that has stopped answering, while it is being backed off from.
+
+    This is a subclass of EasySNMPTimeoutError so that everything which already copes with a device timing out copes
+    with a device being skipped in the same way, just without waiting for the timeout.
+    """
+
+
+class HealthTracker(object):
+    """
+    Circuit breaker for the devices NetStatus contacts over SNMP, keyed by IP address.
+
+    Once a device has timed out (or refused the connection) failure_threshold times in a row, it is skipped for
+    backoff_base seconds, doubling with every further failure up to backoff_max seconds. When that time is up, a
+    single request is let through as a probe (every other request is still skipped until it finishes): if the probe
+    answers, the device is used as normal again, otherwise it is backed off from for longer.
+    """
+
+    def __init__(self, failure_threshold=SNMP_FAILURE_THRESHOLD, backoff_base=SNMP_BACKOFF_BASE,
+                 backoff_max=SNMP_BACKOFF_MAX):
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        # IP address -> [consecutive failures, time until which the device is skipped]
+        self._devices = {}
+
+    def allow(self, ip):
+        """
+        Returns True if the device should be contacted, or False if it should be skipped.
+        """
+        with self._lock:
+            state = self._devices.get(ip)
+
+            if state is None or state[0] < self.failure_threshold:
+                return True
+
+            now = time.time()
+
+            if now < state[1]:
+                return False
+
+            # Let this request through as the probe, and keep skipping the device for everyone else until it is done.
+            # If the probe never reports back (eg. the thread running it is abandoned), another probe is let through
+            # after the same backoff.
+            state[1] = now + self._backoff(state[0])
+            return True
+
+    def record_success(self, ip):
+        with self._lock:
+            self._devices.pop(ip, None)
+
+    def record_failure(self, ip):
+        with self._lock:
+            state = self._devices.setdefault(ip, [0, 0])
+            state[0] += 1
+
+            if state[0] >= self.failure_threshold:
+                state[1] = time.time() + self._backoff(state[0])
+
+    def backing_off(self):
+        """
+        Returns a dictionary of IP address -> number of seconds until the next probe, for every device currently
+        being skipped.
+        """
+        now = time.time()
+
+        with self._lock:
+            return dict((ip, state[1] - now) for ip, state in self._devices.items()
+                        if state[0] >= self.failure_threshold and state[1] > now)
+
+    def _backoff(self, failures):
+        # The exponent is capped so a device that has been dead for a long time doesn't make an enormous number
+        return min(self.backoff_max, self.backoff_base * 2 ** min(failures - self.failure_threshold, 16))
+
+
+# The health of every device contacted by this process
+device_health = HealthTracker()
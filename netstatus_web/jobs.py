@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from django.db.models import F
+
+from .db import close_thread_connection
+from .models import Device, MACtoPort, SearchJob
+from .utils import refresh_search_cache, locate_mac
+
+from netstatus.settings import SEARCH_WORKERS, SEARCH_JOB_MAX_AGE, SEARCH_JOB_TIMEOUT, CORE_SWITCH_IPV4, \
+    MAC_TO_PORT_MAX_AGE, IGNORED_PORT_MAX_AGE
+
+# Threads that run searches in the background of this process, so no separate worker or message broker is needed
+_workers = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+
+
+def start_search(mac_address):
+    """
+    Starts a search for a MAC address (as an integer) in the background, and returns its SearchJob straight away.
+    """
+    now = int(time.time())
+
+    # Searches are only kept for long enough to be looked at
+    SearchJob.objects.filter(created__lt=now - SEARCH_JOB_MAX_AGE).delete()
+
+    job = SearchJob.objects.create(mac_address=mac_address, created=now, updated=now)
+
+    _workers.submit(_run, job.id)
+
+    return job
+
+
+def check_lost(job):
+    """
+    Marks a search that is queued or running as failed if it hasn't made any progress for SEARCH_JOB_TIMEOUT seconds.
+    Searches are run by threads in the process that started them, so one is lost if that process is restarted, and
+    would otherwise never finish. Returns the job, with its new state.
+    """
+    if job.state in (SearchJob.QUEUED, SearchJob.RUNNING) and job.updated < int(time.time()) - SEARCH_JOB_TIMEOUT:
+        error = "The search stopped making progress"
+
+        # Only if it hasn't made progress or finished since it was got
+        if SearchJob.objects.filter(id=job.id, state=job.state, updated=job.updated).update(
+                state=SearchJob.FAILED, error=error):
+            job.state = SearchJob.FAILED
+            job.error = error
+
+    return job
+
+
+def _run(job_id):
+    try:
+        run_search(job_id)
+    except Exception as error:
+        SearchJob.objects.filter(id=job_id).update(state=SearchJob.FAILED, error=str(error))
+    finally:
+        close_thread_connection()
+
+
+def run_search(job_id):
+    """
+    Runs a search: refreshes the search results of every switch whose results have expired, recording progress as
+    each switch is finished with, and then looks for the MAC address in the results. If it isn't there, every online
+    switch is asked directly (see locate_mac).
+    """
+    job = SearchJob.objects.get(id=job_id)
+    jobs = SearchJob.objects.filter(id=job_id)
+
+    device_list = Device.objects.all()
+    now = int(time.time())
+
+    # Every expired switch is refreshed once for its ignored ports and once for its MAC address -> port entries
+    switches = device_list.exclude(ipv4_address=CORE_SWITCH_IPV4)
+    total = (switches.filter(ignored_port_updated__lte=now - IGNORED_PORT_MAX_AGE).count() +
+             switches.filter(mac_to_port_updated__lte=now - MAC_TO_PORT_MAX_AGE).count())
+
+    jobs.update(state=SearchJob.RUNNING, switches_total=total, updated=now)
+
+    def progress(device):
+        jobs.update(switches_done=F('switches_done') + 1, updated=int(time.time()))
+
+    skipped = refresh_search_cache(device_list, progress)
+
+    entry = MACtoPort.objects.current().for_mac(job.mac_address).first()
+
+    if entry is None:
+        # The device may have been connected since the results were collected
+        jobs.update(updated=int(time.time()))
+        entry = locate_mac(job.mac_address, device_list)
+
+    # The refresh may have been run by another search, in which case progress was never called
+    jobs.update(state=SearchJob.DONE, switches_done=total, device_id=entry.device_id if entry else None,
+                port=entry.port if entry else None, skipped=", ".join(sorted(device.name for device in skipped)))
@@ -0,0 +1,46 @@
+import re
+
+# Bare, colon or hyphen separated (00:0a:95:ff:12:34) and Cisco style dotted (000a.95ff.1234) MAC addresses
+MAC_PATTERN = re.compile(r'^(?:[0-9a-f]{2}([:-]?)(?:[0-9a-f]{2}\1){4}[0-9a-f]{2}'
+                         r'|[0-9a-f]{4}\.[0-9a-f]{4}\.[0-9a-f]{4})$')
+
+
+def mac_to_int(mac_address):
+    """
+    Converts a MAC address written in any of the usual ways to the 48-bit integer it is stored as in the database.
+    Raises ValueError if the string isn't a MAC address.
+    """
+    mac_address = mac_address.strip().lower()
+
+    if not MAC_PATTERN.match(mac_address):
+        raise ValueError("Not a MAC address: {0!r}".format(mac_address))
+
+    return int(re.sub('[:.-]', '', mac_address), 16)
+
+
+def int_to_mac(mac_address):
+    """
+    Converts a MAC address stored as an integer to the 12 character hexadecimal string used by the switches.
+    """
+    return format(mac_address, '012x')
+
+
+def decimal_to_int(oid):
+    """
+    Converts the decimal representation of a MAC address at the end of an SNMP OID
+    (eg. mib-2.17.4.3.1.2.0.10.149.255.18.52) to the 48-bit integer it is stored as in the database.
+    """
+    mac_address = 0
+
+    for octet in oid.split(".")[-6:]:
+        mac_address = (mac_address << 8) | int(octet)
+
+    return mac_address
+
+
+def int_to_decimal(mac_address):
+    """
+    Converts a MAC address stored as an integer to the decimal representation used in SNMP OIDs, the opposite of
+    decimal_to_int. For example 0x000a95ff1234 becomes 0.10.149.255.18.52
+    """
+    return ".".join(str((mac_address >> shift) & 0xff) for shift in (40, 32, 24, 16, 8, 0))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from collections import namedtuple
+import time
+
+from netstatus_web.models import Device, MACtoPort, IgnoredPort
+from netstatus_web.macaddr import decimal_to_int
+from netstatus_web.utils import port_ignore_list, store_ignored_ports, store_mac_to_port
+
+# Stands in for the EasySNMP objects returned by a walk, which only need an OID and a value here.
+Variable = namedtuple('Variable', ['oid', 'value'])
+
+
+def legacy_store_ignored_ports(device, lldp_output):
+    """
+    The way LLDP output used to be stored: two ignore list queries and an INSERT for every row.
+    """
+    for i in lldp_output:
+        if (i.oid.replace("iso.0.8802.1.1.2.1.4.1.1.4.0.", "")[:-2] not in port_ignore_list(device)) and (i.oid.replace("iso.0.8802.1.1.2.1.4.1.1.4.0.", "")[:-2] != ""):
+            entry = IgnoredPort(device=device, port=i.oid.replace("iso.0.8802.1.1.2.1.4.1.1.4.0.", "")[:-2])
+            entry.save()
+
+
+def legacy_store_mac_to_port(device, port_address_table):
+    """
+    The way port tables used to be stored: an ignore list query and an INSERT for every row.
+    """
+    for item in port_address_table:
+        if int(item.value) not in port_ignore_list(device):
+            entry = MACtoPort(device=device, mac_address=decimal_to_int(item.oid), port=item.value)
+            entry.save()
+
+
+class Command(BaseCommand):
+    """
+    Compares the number of queries (and time) needed to store a switch's LLDP output and port table the old, row by
+    row, way with the bulk insert pipeline used by update_ignored_ports and update_mac_to_port.
+
+    Everything runs inside a transaction that is rolled back, so no data is left behind in the database.
+    """
+
+    help = "Benchmarks the number of database queries used to store the tables collected from a switch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--macs', type=int, default=2000, help="Learned MAC addresses (default: %(default)s).")
+        parser.add_argument('--ports', type=int, default=48, help="Ports on the switch (default: %(default)s).")
+        parser.add_argument('--uplinks', type=int, default=2, help="LLDP neighbours (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        # LLDP output has an OID per neighbour, ending in the local port and an index
+        lldp_output = [Variable("iso.0.8802.1.1.2.1.4.1.1.4.0.{0}.1".format(port), "4")
+                       for port in range(1, options['uplinks'] + 1)]
+
+        # The MAC address in decimal form is at the end of the OID, and the port is the value
+        port_address_table = [Variable("mib-2.17.4.3.1.2.0.{0}.{1}.{2}.{3}.{4}".format(
+            *[(n >> shift) & 0xff for shift in (32, 24, 16, 8, 0)]), str(n % options['ports'] + 1))
+            for n in range(options['macs'])]
+
+        self.stdout.write("{0} port table rows, {1} LLDP rows, {2} ports".format(
+            len(port_address_table), len(lldp_output), options['ports']))
+
+        for name, store_lldp, store_fdb in (('row by row', legacy_store_ignored_ports, legacy_store_mac_to_port),
+                                            ('bulk', store_ignored_ports, store_mac_to_port)):
+            with transaction.atomic():
+                device = Device.objects.create(name="benchmark", ipv4_address="192.0.2.1", location_x=0,
+                                               location_y=0, online=True, system_version="")
+
+                for table, store in (('LLDP', store_lldp), ('port table', store_fdb)):
+                    rows = lldp_output if table == 'LLDP' else port_address_table
+
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.time()
+                        store(device, rows)
+                        elapsed = time.time() - started
+
+                    self.stdout.write("{0:>10}, {1:<10}: {2:>5} queries, {3:.3f}s".format(
+                        name, table, len(queries.captured_queries), elapsed))
+
+                transaction.set_rollback(True)
@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+import time
+
+from netstatus.settings import POLL_INTERVAL, ARP_HARVEST_INTERVAL, TIMESERIES_INTERVAL, STATUS_EVENT_MAX_AGE
+from netstatus_web.models import Device, StatusEvent
+from netstatus_web.health import device_health
+from netstatus_web.sessions import session_pool
+from netstatus_web.utils import update_device_status, harvest_arp_cache
+
+
+class Command(BaseCommand):
+    """
+    Long running poller that owns the reachability sweep of every device tracked by NetStatus. It also harvests the
+    routers' ARP tables every ARP_HARVEST_INTERVAL seconds, for searching by IPv4 address, and records the interface
+    counters of every online device every TIMESERIES_INTERVAL seconds (unless it is 0).
+
+    The web pages only ever read the stored Device.online state, so this needs to be left running (eg. under
+    systemd or supervisord) for the dashboard and device list to stay up to date. Devices going online or offline are
+    also recorded as StatusEvents, which are streamed to the device list's map.
+    """
+
+    help = "Periodically checks whether every tracked device is online and stores the result in the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=POLL_INTERVAL,
+                            help="Seconds between the start of each sweep (default: %(default)s).")
+        parser.add_argument('--once', action='store_true',
+                            help="Run a single sweep and exit, eg. when being run from cron.")
+
+    def handle(self, *args, **options):
+        last_harvest = 0
+        last_counters = 0
+
+        while True:
+            started = time.time()
+
+            online, offline = update_device_status(Device.objects.all())
+
+            # The map only needs recent changes, as it gets the current state of every device when it is loaded
+            StatusEvent.objects.filter(time__lt=started - STATUS_EVENT_MAX_AGE).delete()
+
+            if options['verbosity'] > 1:
+                self.stdout.write("Swept {0} devices in {1:.1f}s: {2} online, {3} offline.".format(
+                    online + offline, time.time() - started, online, offline))
+
+                for ip, remaining in sorted(device_health.backing_off().items()):
+                    self.stdout.write("Backing off from {0}, next checked in {1:.0f}s.".format(ip, remaining))
+
+            if started - last_harvest >= ARP_HARVEST_INTERVAL:
+                last_harvest = started
+                entries = harvest_arp_cache()
+
+                if options['verbosity'] > 1:
+                    self.stdout.write("Harvested {0} ARP entries.".format(entries))
+
+            if TIMESERIES_INTERVAL and started - last_counters >= TIMESERIES_INTERVAL:
+                last_counters = started
+
+                # Recording the counters is a nice to have, so a failure (eg. NumPy not being installed, or
+                # TIMESERIES_DIR being full) is reported and the poller carries on keeping the device states up to date
+                try:
+                    # Only imported here, as recording the counters needs NumPy
+                    from netstatus_web.counters import record_interface_counters
+
+                    recorded, errors, dropped = record_interface_counters(Device.objects.filter(online=True))
+                except Exception as error:
+                    self.stderr.write("Couldn't record the interface counters: {0}".format(error))
+                else:
+                    for device, error in errors.items():
+                        self.stderr.write("Couldn't store the interface counters of {0}: {1}".format(
+                            device.name, error))
+
+                    for device, ports in dropped.items():
+                        self.stderr.write("{0} has more ports than fit in its counter store (TIMESERIES_PORTS), so "
+                                          "{1} ports aren't being recorded.".format(device.name, len(ports)))
+
+                    if options['verbosity'] > 1:
+                        self.stdout.write("Recorded the interface counters of {0} devices.".format(recorded))
+
+            if options['once']:
+                break
+
+            # Don't hold a database connection, or SNMP sessions nobody has used for a while, open while we are
+            # sleeping between sweeps.
+            connection.close()
+            session_pool.reap()
+
+            # Keep to a fixed schedule, so a slow sweep doesn't push every later sweep back.
+            time.sleep(max(0, options['interval'] - (time.time() - started)))
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import random
+import socket
+
+from netstatus.settings import SNMP_TRAP_PORT, SNMP_TRAP_COMMUNITY
+from netstatus_web.traps import encode_notification, decode_response_id, TrapDecodeError, TRAP_V2, INFORM, \
+    TIME_TICKS, IP_ADDRESS, SYS_UP_TIME, SNMP_TRAP_OID, SNMP_TRAP_ADDRESS, COLD_START, WARM_START, \
+    LINK_DOWN, LINK_UP, LLDP_REM_TABLES_CHANGE, IF_INDEX
+
+NOTIFICATIONS = {
+    'coldStart': COLD_START,
+    'warmStart': WARM_START,
+    'linkDown': LINK_DOWN,
+    'linkUp': LINK_UP,
+    'lldpRemTablesChange': LLDP_REM_TABLES_CHANGE,
+}
+
+
+class Command(BaseCommand):
+    """
+    Sends an SNMPv2c trap (or inform) as if it came from a device, for checking that trap_receiver is working. The
+    trap says which device it is from in snmpTrapAddress.0, as a proxy passing on a trap would, which the receiver
+    only believes when the trap is sent from this server (or one of SNMP_TRAP_PROXIES).
+    """
+
+    help = "Sends a test SNMP trap or inform to the trap receiver as if it came from a device."
+
+    def add_arguments(self, parser):
+        parser.add_argument('notification', choices=sorted(NOTIFICATIONS))
+        parser.add_argument('device', help="IPv4 address of the device the trap is from.")
+        parser.add_argument('--host', default='127.0.0.1',
+                            help="Address of the trap receiver (default: %(default)s).")
+        parser.add_argument('--port', type=int, default=SNMP_TRAP_PORT,
+                            help="UDP port of the trap receiver (default: %(default)s).")
+        parser.add_argument('--community', default=SNMP_TRAP_COMMUNITY)
+        parser.add_argument('--ifindex', type=int, default=1,
+                            help="Port a linkUp or linkDown is about (default: %(default)s).")
+        parser.add_argument('--inform', action='store_true',
+                            help="Send an inform and wait for the receiver to answer it.")
+
+    def handle(self, *args, **options):
+        trap_oid = NOTIFICATIONS[options['notification']]
+        request_id = random.randint(1, 2 ** 31 - 1)
+
+        varbinds = [(SYS_UP_TIME, (TIME_TICKS, 0)), (SNMP_TRAP_OID, trap_oid),
+                    (SNMP_TRAP_ADDRESS, (IP_ADDRESS, options['device']))]
+
+        if trap_oid in (LINK_UP, LINK_DOWN):
+            varbinds.append(("{0}.{1}".format(IF_INDEX, options['ifindex']), options['ifindex']))
+
+        message = encode_notification(options['community'], INFORM if options['inform'] else TRAP_V2, request_id,
+                                      varbinds)
+
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.settimeout(5)
+        sender.sendto(message, (options['host'], options['port']))
+
+        if not options['inform']:
+            self.stdout.write("Sent {0} from {1}.".format(options['notification'], options['device']))
+            return
+
+        try:
+            answered = decode_response_id(sender.recv(65535)) == request_id
+        except socket.timeout:
+            raise CommandError("The inform wasn't answered.")
+        except TrapDecodeError:
+            answered = False
+
+        if not answered:
+            raise CommandError("The inform was answered with something other than its response.")
+
+        self.stdout.write("Sent {0} from {1}, and it was answered.".format(options['notification'], options['device']))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+import socket
+
+from netstatus.settings import SNMP_TRAP_PORT, SNMP_TRAP_COMMUNITY
+from netstatus_web.traps import decode_notification, encode_inform_response, TrapDecodeError, INFORM
+from netstatus_web.utils import handle_notification
+
+
+class Command(BaseCommand):
+    """
+    Long running listener for the SNMP traps and informs sent by the tracked devices (SNMPv1 or v2c, with the community
+    SNMP_TRAP_COMMUNITY). A device sending one is marked online straight away, and the search results affected by a
+    restart, a port going up or down, or its LLDP neighbours changing are marked as expired (see handle_notification).
+
+    Devices need to be set up to send traps to this server. As changes are then seen as they happen, poll_devices can
+    be run with a much longer --interval.
+    """
+
+    help = "Listens for SNMP traps and informs from the tracked devices and updates their state as they arrive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default='0.0.0.0',
+                            help="Address to listen on (default: %(default)s).")
+        parser.add_argument('--port', type=int, default=SNMP_TRAP_PORT,
+                            help="UDP port to listen on (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        if not SNMP_TRAP_COMMUNITY:
+            raise CommandError("Set SNMP_TRAP_COMMUNITY to the community the devices send traps with.")
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind((options['address'], options['port']))
+
+        if options['verbosity'] > 1:
+            self.stdout.write("Listening for traps on {0}:{1}.".format(options['address'], options['port']))
+
+        while True:
+            data, (source_address, source_port) = listener.recvfrom(65535)
+
+            try:
+                notification = decode_notification(data)
+            except TrapDecodeError as error:
+                if options['verbosity'] > 1:
+                    self.stdout.write("Ignored a message from {0}: {1}.".format(source_address, error))
+                continue
+
+            if notification.community != SNMP_TRAP_COMMUNITY:
+                if options['verbosity'] > 1:
+                    self.stdout.write("Ignored a notification from {0} with the wrong community.".format(
+                        source_address))
+                continue
+
+            try:
+                if notification.pdu_type == INFORM:
+                    # The agent keeps resending an inform until it is answered
+                    listener.sendto(encode_inform_response(notification), (source_address, source_port))
+
+                # The connection may have been closed by the database server while waiting for a notification
+                close_old_connections()
+
+                device = handle_notification(notification, source_address)
+            except Exception as error:
+                # Eg. the database being restarted. Only this notification is lost, and the next one is handled with a
+                # new database connection, rather than the receiver stopping until someone restarts it.
+                self.stderr.write("Couldn't handle {0} from {1}: {2}".format(notification.trap_oid, source_address,
+                                                                             error))
+                connection.close()
+                continue
+
+            if options['verbosity'] > 1:
+                self.stdout.write("Got {0} from {1}{2}.".format(
+                    notification.trap_oid, source_address,
+                    " ({0})".format(device.name) if device else ", which isn't a tracked device"))
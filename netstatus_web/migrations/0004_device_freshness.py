@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0003_auto_20160313_1801'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='LastUpdated',
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='ignored_port_updated',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='mac_to_port_updated',
+            field=models.IntegerField(default=0),
+        ),
+    ]
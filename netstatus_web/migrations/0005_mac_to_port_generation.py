@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0004_device_freshness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='mac_to_port_generation',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mactoport',
+            name='generation',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
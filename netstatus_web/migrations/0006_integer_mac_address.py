@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from netstatus_web.db import update_each
+
+
+def clear_mac_to_port(apps, schema_editor):
+    """
+    Deletes the stored entries rather than converting their 12 character hexadecimal MAC addresses to integers. Older
+    versions could store the same MAC address twice for a switch (two searches refreshing it at once), which the new
+    unique constraint wouldn't allow, and could drop leading zeros from an octet. Every switch is marked as expired,
+    so the entries are collected again by the next search.
+    """
+    MACtoPort = apps.get_model('netstatus_web', 'MACtoPort')
+    Device = apps.get_model('netstatus_web', 'Device')
+
+    MACtoPort.objects.all().delete()
+    Device.objects.update(mac_to_port_updated=0)
+
+
+def int_to_hex(apps, schema_editor):
+    MACtoPort = apps.get_model('netstatus_web', 'MACtoPort')
+
+    update_each(MACtoPort.objects, [(id, {'mac_address': format(mac_address_int, '012x')})
+                                    for id, mac_address_int in MACtoPort.objects.values_list('id', 'mac_address_int')],
+                {'mac_address': models.CharField(max_length=12)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0005_mac_to_port_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mactoport',
+            name='mac_address_int',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='mactoport',
+            name='mac_address',
+            field=models.CharField(max_length=12, null=True),
+        ),
+        migrations.RunPython(clear_mac_to_port, int_to_hex),
+        migrations.RemoveField(
+            model_name='mactoport',
+            name='mac_address',
+        ),
+        migrations.RenameField(
+            model_name='mactoport',
+            old_name='mac_address_int',
+            new_name='mac_address',
+        ),
+        migrations.AlterField(
+            model_name='mactoport',
+            name='mac_address',
+            field=models.BigIntegerField(db_index=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mactoport',
+            unique_together=set([('device', 'generation', 'mac_address')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='ignoredport',
+            index_together=set([('device', 'port')]),
+        ),
+    ]
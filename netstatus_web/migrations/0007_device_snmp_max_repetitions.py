@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0006_integer_mac_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='snmp_max_repetitions',
+            field=models.PositiveSmallIntegerField(default=25),
+        ),
+    ]
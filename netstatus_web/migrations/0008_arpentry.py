@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0007_device_snmp_max_repetitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArpEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ipv4_address', models.GenericIPAddressField(unique=True)),
+                ('mac_address', models.BigIntegerField()),
+                ('updated', models.IntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0008_arpentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='snmp_retries',
+            field=models.PositiveSmallIntegerField(default=2),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='snmp_rttvar',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='snmp_srtt',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='snmp_timeout',
+            field=models.FloatField(default=1.0),
+        ),
+    ]
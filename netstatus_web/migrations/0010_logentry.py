@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0009_device_snmp_rtt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_index', models.PositiveIntegerField()),
+                ('log_index', models.PositiveIntegerField()),
+                ('description', models.TextField()),
+                ('severity', models.CharField(max_length=1)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='netstatus_web.Device')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='logentry',
+            unique_together=set([('device', 'event_index', 'log_index')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='logentry',
+            index_together=set([('device', 'severity')]),
+        ),
+    ]
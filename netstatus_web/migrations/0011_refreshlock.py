@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0010_logentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshLock',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('owner', models.CharField(max_length=32)),
+                ('expires', models.FloatField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0011_refreshlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('mac_address', models.BigIntegerField()),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=7)),
+                ('created', models.IntegerField()),
+                ('switches_total', models.IntegerField(default=0)),
+                ('switches_done', models.IntegerField(default=0)),
+                ('port', models.IntegerField(blank=True, null=True)),
+                ('skipped', models.TextField(blank=True, default='')),
+                ('error', models.TextField(blank=True, default='')),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='netstatus_web.Device')),
+            ],
+        ),
+    ]
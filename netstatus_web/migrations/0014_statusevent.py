@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 02:44
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0013_device_status_changed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.IntegerField()),
+                ('online', models.BooleanField()),
+                ('time', models.IntegerField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 03:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('netstatus_web', '0014_statusevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='updated',
+            field=models.IntegerField(default=0),
+        ),
+    ]
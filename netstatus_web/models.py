@@ -1,6 +1,9 @@
 from django.db import models
-from django.core.validators import RegexValidator
-import re
+import uuid
+
+from .macaddr import mac_to_int, int_to_mac
+
+from netstatus.settings import SNMP_MAX_REPETITIONS, SNMP_TIMEOUT_INITIAL, SNMP_RETRIES_INITIAL
 
 # Create your models here.
 
@@ -12,24 +15,155 @@ class Device(models.Model):
     location_x = models.DecimalField(decimal_places=20, max_digits=100)
     location_y = models.DecimalField(decimal_places=20, max_digits=100)
     online = models.BooleanField()
+    # Unix timestamp of when online last changed, used to tell whether the online/offline chart has changed
+    status_changed = models.IntegerField(default=0)
     system_version = models.CharField(max_length=999)
+    # Unix timestamps of when the MACtoPort and IgnoredPort entries for this device were last refreshed. 0 means
+    # never, which forces a refresh the next time a search is made.
+    mac_to_port_updated = models.IntegerField(default=0)
+    ignored_port_updated = models.IntegerField(default=0)
+    # The generation of MACtoPort entries that is currently being served for this device. See MACtoPort.generation.
+    mac_to_port_generation = models.BigIntegerField(default=0)
+    # Number of table rows asked for in each SNMP GETBULK request when reading tables from this device. 0 reads tables
+    # one row at a time with GETNEXT instead, for devices that don't support GETBULK properly.
+    snmp_max_repetitions = models.PositiveSmallIntegerField(default=SNMP_MAX_REPETITIONS)
+    # Smoothed round trip time and round trip time variation (in seconds) of SNMP requests to this device, which are
+    # None until it has answered one, and the timeout (in seconds) and retries worked out from them. See rtt.py.
+    snmp_srtt = models.FloatField(null=True, blank=True)
+    snmp_rttvar = models.FloatField(null=True, blank=True)
+    snmp_timeout = models.FloatField(default=SNMP_TIMEOUT_INITIAL)
+    snmp_retries = models.PositiveSmallIntegerField(default=SNMP_RETRIES_INITIAL)
 
     def __str__(self):
         return '{0}'.format(self.name)
 
 
+class MACtoPortQuerySet(models.QuerySet):
+    def current(self):
+        """
+        Only the entries that belong to the generation currently being served for their device.
+        """
+        return self.filter(generation=models.F('device__mac_to_port_generation'))
+
+    def for_mac(self, mac_address):
+        """
+        Only the entries for a MAC address, which can be given as an integer or written in any of the usual ways.
+        """
+        if not isinstance(mac_address, int):
+            mac_address = mac_to_int(mac_address)
+
+        return self.filter(mac_address=mac_address)
+
+
 class MACtoPort(models.Model):
     device = models.ForeignKey(Device)
-    mac_address = models.CharField(max_length=12, validators=[RegexValidator(
-        regex='^([a-fA-F0-9]{2}){5}([a-fA-F0-9]{2})$')])
+    # Stored as a 48-bit integer rather than a string, so it is compact and can be indexed efficiently
+    mac_address = models.BigIntegerField(db_index=True)
     port = models.IntegerField()
+    # When a device is refreshed its new entries are written under a new generation, which is only served once every
+    # entry has been written and Device.mac_to_port_generation is changed to it. Until then searches keep using the
+    # previous generation, so they never see a half built table.
+    generation = models.BigIntegerField(default=0)
+
+    objects = MACtoPortQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('device', 'generation', 'mac_address')
+
+    @property
+    def mac_address_hex(self):
+        return int_to_mac(self.mac_address)
 
 
 class IgnoredPort(models.Model):
     device = models.ForeignKey(Device)
     port = models.IntegerField()
 
+    class Meta:
+        index_together = [('device', 'port')]
+
+
+class ArpEntry(models.Model):
+    """
+    An IPv4 address -> MAC address entry harvested from a router's ARP table, used when searching for a device by
+    its IPv4 address.
+    """
+    ipv4_address = models.GenericIPAddressField(unique=True)
+    mac_address = models.BigIntegerField()
+    # Unix timestamp of when the entry was harvested
+    updated = models.IntegerField()
+
 
-class LastUpdated(models.Model):
-    mac_to_port = models.IntegerField()
-    ignored_port = models.IntegerField()
+class LogEntry(models.Model):
+    """
+    An entry from a device's RMON log table (logDescription, mib-2.16.9.2.1.4), which is indexed by the event that
+    logged it and a log index that goes up with every entry. Entries are collected incrementally, so only entries
+    newer than the ones already stored are got from the device.
+    """
+    device = models.ForeignKey(Device)
+    event_index = models.PositiveIntegerField()
+    log_index = models.PositiveIntegerField()
+    description = models.TextField()
+    # The first letter of the description, eg. W for warnings and I for informational entries
+    severity = models.CharField(max_length=1)
+
+    class Meta:
+        unique_together = ('device', 'event_index', 'log_index')
+        index_together = [('device', 'severity')]
+
+
+class RefreshLock(models.Model):
+    """
+    A lease held by whichever thread (in any process) is running a refresh, so that the same refresh is only ever run
+    once at a time. See singleflight.py.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    # Random ID of the holder, so only the holder releases the lease
+    owner = models.CharField(max_length=32)
+    # Unix timestamp after which the lease is treated as abandoned (eg. the process holding it was killed)
+    expires = models.FloatField()
+
+
+class SearchJob(models.Model):
+    """
+    A search for a device, run in the background by jobs.py so that refreshing the search results doesn't have to
+    happen inside the request. The search page polls the job's progress until it has finished.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    mac_address = models.BigIntegerField()
+    state = models.CharField(max_length=7, choices=STATES, default=QUEUED)
+    # Unix timestamp of when the search was started, and of when it last made progress
+    created = models.IntegerField()
+    updated = models.IntegerField(default=0)
+    # Number of switches that need refreshing for this search, and how many of them have been finished with
+    switches_total = models.IntegerField(default=0)
+    switches_done = models.IntegerField(default=0)
+    # Where the device was found, once the search is done. Both are None if it wasn't found.
+    device = models.ForeignKey(Device, null=True, blank=True, on_delete=models.SET_NULL)
+    port = models.IntegerField(null=True, blank=True)
+    # Names of the switches that couldn't be refreshed, separated by commas
+    skipped = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    @property
+    def mac_address_hex(self):
+        return int_to_mac(self.mac_address)
+
+
+class StatusEvent(models.Model):
+    """
+    A device going online or offline, recorded by the poller so that the device map can be updated as it happens
+    (see events.py). Only kept for a while, as the current state is always in Device.online.
+    """
+    # Not a foreign key, so the map is still told about a device that has since been removed
+    device_id = models.IntegerField()
+    online = models.BooleanField()
+    # Unix timestamp of when the change was seen
+    time = models.IntegerField(db_index=True)
@@ -0,0 +1,237 @@
+import os
+import warnings
+
+import numpy as np
+
+from netstatus.settings import TIMESERIES_DIR, TIMESERIES_INTERVAL, TIMESERIES_ROLLUPS
+from .timeseries import COUNTERS, MISSING
+
+# The statistics stored for every counter in each bucket, in the order they are stored in
+STATISTICS = ('min', 'avg', 'max', 'p95')
+
+# Each counter wraps back to 0 at its mask + 1. The octet counters are 64 bits wide (ifHCInOctets/ifHCOutOctets) and
+# the error and discard counters 32 bits wide.
+MASKS = np.array([2 ** 64 - 1, 2 ** 64 - 1, 2 ** 32 - 1, 2 ** 32 - 1, 2 ** 32 - 1, 2 ** 32 - 1], dtype=np.uint64)
+
+# Identifies a rollup store file, and the version of its layout
+MAGIC = 0x4e535231  # "NSR1"
+VERSION = 1
+
+# Header fields: magic, version, seconds per bucket, buckets, ports, counters, statistics, timestamp of the last sample
+# rolled up
+HEADER_SIZE = 8
+UPDATED = 7
+
+
+def counter_rates(timestamps, counters):
+    """
+    Turns samples of counters (as stored by a CounterStore) into the rate per second each counter went up at between
+    every sample and the one before it. Returns (timestamps, rates), where the timestamps are those of the later
+    sample of each pair and rates is a float array with one less sample than counters.
+
+    A rate is NaN if either sample is missing the counter, or the counter went backwards when it can't have wrapped
+    (a 64-bit counter, which would take years to), which means it was reset (eg. the device was restarted).
+    """
+    if len(timestamps) < 2:
+        return timestamps[:0], np.empty((0,) + counters.shape[1:])
+
+    previous, current = counters[:-1], counters[1:]
+
+    # Unsigned subtraction wraps around, so this is the right difference for a counter that has wrapped since the
+    # sample before, once it is cut down to the width of the counter
+    deltas = (current - previous) & MASKS
+
+    seconds = np.diff(timestamps).astype(np.float64)
+    rates = deltas / seconds[:, np.newaxis, np.newaxis]
+
+    invalid = (previous == MISSING) | (current == MISSING) | ((current < previous) & (MASKS == MISSING))
+    invalid |= (seconds <= 0)[:, np.newaxis, np.newaxis]
+    rates[invalid] = np.nan
+
+    return timestamps[1:], rates
+
+
+def bucket_statistics(timestamps, rates, seconds):
+    """
+    Works out the minimum, average, maximum and 95th percentile of rates (see counter_rates) in each bucket of the
+    given number of seconds. Returns (starts, statistics), where starts is the start time of every bucket that has
+    any rates and statistics is a (buckets x ports x counters x STATISTICS) array, NaN where a bucket has no rate
+    for a counter.
+
+    A rate belongs to the bucket that the time it ends at falls in, except that one ending exactly at the start of a
+    bucket belongs to the bucket before, as it was all measured before then.
+    """
+    if not len(timestamps):
+        return timestamps[:0], np.empty((0,) + rates.shape[1:] + (len(STATISTICS),))
+
+    buckets = (timestamps - 1) // seconds * seconds
+    starts, first = np.unique(buckets, return_index=True)
+
+    valid = ~np.isnan(rates)
+    counts = np.add.reduceat(valid.astype(np.int64), first, axis=0)
+
+    statistics = np.empty((len(starts),) + rates.shape[1:] + (len(STATISTICS),))
+
+    with warnings.catch_warnings():
+        # Buckets with no rates for a counter give NaN, which is what is wanted, along with a warning, which isn't
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        # fmin and fmax ignore NaN, so every bucket is done at once
+        statistics[..., 0] = np.fmin.reduceat(rates, first, axis=0)
+        statistics[..., 1] = np.add.reduceat(np.where(valid, rates, 0), first, axis=0) / counts
+        statistics[..., 2] = np.fmax.reduceat(rates, first, axis=0)
+
+        # Percentiles need the rates of each bucket sorted, so are done a bucket at a time
+        for bucket, (low, high) in enumerate(zip(first, list(first[1:]) + [len(rates)])):
+            statistics[bucket, ..., 3] = np.nanpercentile(rates[low:high], 95, axis=0)
+
+    return starts, statistics
+
+
+class RollupStore(object):
+    """
+    A fixed size store of the statistics of every counter of a device over buckets of one size (eg. every hour), kept
+    in a memory mapped file next to the device's counter store.
+
+    The file holds a small header, then the start time of the bucket stored in each slot and a (slots x ports x
+    counters x STATISTICS) array of 32-bit floats. A bucket is always stored in the slot its start time divided by the
+    bucket size falls in (modulo the number of slots), so a bucket can be found or replaced without searching, and
+    the oldest bucket is replaced as each new one starts. The ports are in the same columns as in the counter store.
+    """
+
+    def __init__(self, path, seconds, slots, ports, readonly=False):
+        """
+        Opens the store at path, creating it with room for 'slots' buckets of 'seconds' seconds of 'ports' ports if it
+        doesn't exist (and readonly is False). An existing store keeps the size it was created with.
+        """
+        exists = os.path.exists(path)
+
+        if not exists and readonly:
+            raise IOError("No rollup store at {0}".format(path))
+
+        if exists:
+            header = np.memmap(path, dtype=np.int64, mode='r', shape=(HEADER_SIZE,))
+
+            if header[0] != MAGIC or header[1] != VERSION or header[5] != len(COUNTERS) or \
+                    header[6] != len(STATISTICS):
+                raise ValueError("{0} isn't a rollup store".format(path))
+
+            seconds, slots, ports = int(header[2]), int(header[3]), int(header[4])
+            del header
+        else:
+            with open(path, 'wb') as store:
+                store.truncate(8 * (HEADER_SIZE + slots) + 4 * slots * ports * len(COUNTERS) * len(STATISTICS))
+
+        self.path = path
+        self.seconds = seconds
+        self.slots = slots
+
+        mode = 'r' if readonly else 'r+'
+
+        offset = 0
+        self._header = np.memmap(path, dtype=np.int64, mode=mode, shape=(HEADER_SIZE,))
+        offset += self._header.nbytes
+
+        # Start time of the bucket stored in each slot, or -1 for a slot that hasn't been used yet
+        self._starts = np.memmap(path, dtype=np.int64, mode=mode, offset=offset, shape=(slots,))
+        offset += self._starts.nbytes
+
+        self._statistics = np.memmap(path, dtype=np.float32, mode=mode, offset=offset,
+                                     shape=(slots, ports, len(COUNTERS), len(STATISTICS)))
+
+        if not exists:
+            self._header[:] = (MAGIC, VERSION, seconds, slots, ports, len(COUNTERS), len(STATISTICS), 0)
+            self._starts[:] = -1
+            self.flush()
+
+    @property
+    def updated(self):
+        """
+        The timestamp of the last sample that has been rolled up, or 0 if none have been.
+        """
+        return int(self._header[UPDATED])
+
+    def store(self, starts, statistics, updated):
+        """
+        Stores the statistics of the buckets starting at starts (see bucket_statistics), replacing whatever was
+        stored for them before, and records updated as the timestamp of the last sample rolled up.
+        """
+        slots = starts // self.seconds % self.slots
+
+        self._statistics[slots] = np.nan
+        self._statistics[slots, :statistics.shape[1]] = statistics
+        self._starts[slots] = starts
+        self._header[UPDATED] = updated
+
+    def read(self, start, end):
+        """
+        Returns the buckets starting from start to end (Unix timestamps, inclusive) that have been stored, as (starts,
+        statistics), where statistics is a (buckets x ports x counters x STATISTICS) array.
+        """
+        first = max(start // self.seconds, end // self.seconds - self.slots + 1) * self.seconds
+        starts = np.arange(first, end + 1, self.seconds, dtype=np.int64)
+        slots = starts // self.seconds % self.slots
+
+        # A slot may still hold an older bucket, or none, so only the ones that match are returned
+        stored = self._starts[slots] == starts
+
+        return starts[stored], np.asarray(self._statistics[slots[stored]])
+
+    def flush(self):
+        """
+        Writes any changes out to the file.
+        """
+        for array in (self._statistics, self._starts, self._header):
+            if array.mode != 'r':
+                array.flush()
+
+
+def rollup_path(device_id, name):
+    """
+    Returns the path of a rollup store of a device, where name is one of the names in TIMESERIES_ROLLUPS.
+    """
+    return os.path.join(TIMESERIES_DIR, "{0}.{1}.rollup".format(device_id, name))
+
+
+def open_rollup(device_id, name, ports, readonly=False):
+    """
+    Opens a rollup store of a device, where name is one of the names in TIMESERIES_ROLLUPS, creating it with room for
+    'ports' ports if it doesn't exist yet, unless readonly is True, in which case IOError is raised.
+    """
+    for rollup, seconds, slots in TIMESERIES_ROLLUPS:
+        if rollup == name:
+            return RollupStore(rollup_path(device_id, name), seconds, slots, ports, readonly=readonly)
+
+    raise KeyError(name)
+
+
+def update_rollups(device_id, counter_store):
+    """
+    Brings every rollup store of a device up to date with its counter store. Only the buckets that samples have been
+    added to since the last update are worked out again, so this is cheap to call after every sample.
+    """
+    rollups = [open_rollup(device_id, name, counter_store.max_ports) for name, seconds, slots in TIMESERIES_ROLLUPS]
+
+    # Each store needs the bucket its last sample fell in worked out again, as samples have been added to it since
+    since = min(rollup.updated // rollup.seconds * rollup.seconds for rollup in rollups)
+
+    # The sample before the first one in the earliest bucket is needed to get the first rate. The poller takes a
+    # sample every TIMESERIES_INTERVAL seconds, so it will be within twice that unless the poller was stopped, in which
+    # case there is no rate from before then to get anyway.
+    timestamps, counters = counter_store.read(since - 2 * TIMESERIES_INTERVAL if since else None)
+
+    if not len(timestamps):
+        return
+
+    timestamps, rates = counter_rates(timestamps, counters)
+
+    for rollup in rollups:
+        begin = rollup.updated // rollup.seconds * rollup.seconds
+
+        # Rates ending exactly at the start of the bucket belong to the one before (see bucket_statistics)
+        recent = timestamps > begin
+
+        starts, statistics = bucket_statistics(timestamps[recent], rates[recent], rollup.seconds)
+
+        rollup.store(starts, statistics, int(timestamps[-1]) if len(timestamps) else rollup.updated)
+        rollup.flush()
@@ -0,0 +1,71 @@
+import math
+
+from netstatus.settings import SNMP_TIMEOUT_MIN, SNMP_TIMEOUT_MAX, SNMP_REQUEST_BUDGET
+
+# Gains used to smooth the round trip time and its variation, the same as TCP uses (RFC 6298)
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+
+# Most retries ever made of a single SNMP request
+MAX_RETRIES = 5
+
+
+def smooth_rtt(srtt, rttvar, sample):
+    """
+    Adds a round trip time sample (in seconds) to the smoothed round trip time and variation of a device, and returns
+    the new (srtt, rttvar). srtt and rttvar are None for a device that hasn't been timed before.
+    """
+    if srtt is None:
+        return sample, sample / 2
+
+    rttvar = (1 - RTT_BETA) * rttvar + RTT_BETA * abs(srtt - sample)
+    srtt = (1 - RTT_ALPHA) * srtt + RTT_ALPHA * sample
+
+    return srtt, rttvar
+
+
+def rtt_timeout(srtt, rttvar):
+    """
+    Returns the timeout (in seconds) to use for a device with the given smoothed round trip time and variation.
+
+    Like TCP's retransmission timeout this is srtt + 4 * rttvar, but it is rounded up to the next 50ms so that small
+    changes don't stop pooled sessions (which are created with a fixed timeout) being reused.
+    """
+    timeout = min(SNMP_TIMEOUT_MAX, max(SNMP_TIMEOUT_MIN, srtt + 4 * rttvar))
+
+    return math.ceil(round(timeout * 20, 6)) / 20
+
+
+def backoff_timeout(timeout):
+    """
+    Returns the timeout to use for a device that didn't answer within the given timeout, which may only be because
+    the timeout was too short (eg. a slow switch that is busy).
+    """
+    return min(SNMP_TIMEOUT_MAX, timeout * 2)
+
+
+def timeout_retries(timeout):
+    """
+    Returns how many times a request with the given timeout can be retried within SNMP_REQUEST_BUDGET seconds. A
+    device that answers quickly can be retried several times when a packet is dropped, while a slow device gets fewer,
+    longer, attempts.
+    """
+    return min(MAX_RETRIES, max(1, int(SNMP_REQUEST_BUDGET / timeout) - 1))
+
+
+def next_rtt_state(srtt, rttvar, timeout, sample):
+    """
+    Returns the new (srtt, rttvar, timeout, retries) of a device after it was 'pinged' with the given timeout, and
+    answered after sample seconds, or didn't answer if sample is None.
+
+    A sample longer than the timeout means the request was retried, and it isn't known which attempt was answered, so
+    it is ignored (Karn's algorithm). The timeout is still backed off, as it was too short for the device to answer
+    the first attempt, and is kept until a sample within it is got.
+    """
+    if sample is None or sample > timeout:
+        timeout = backoff_timeout(timeout)
+    else:
+        srtt, rttvar = smooth_rtt(srtt, rttvar, sample)
+        timeout = rtt_timeout(srtt, rttvar)
+
+    return srtt, rttvar, timeout, timeout_retries(timeout)
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
+from easysnmp import Session
+from easysnmp import exceptions
+
+from netstatus.settings import SNMP_POOL_MAX_SIZE, SNMP_POOL_MAX_IDLE
+
+
+class SessionPool(object):
+    """
+    Keeps EasySNMP sessions open between uses, so that repeatedly contacting the same device doesn't have to set up a
+    new session (and initialise the MIBs) every time.
+
+    Sessions are keyed by everything they were created with (host, community, version, timeout and retries), and each
+    one is only ever used by one thread at a time. At most max_size idle sessions are kept, the least recently used
+    being closed first, and a session that hasn't been used for max_idle seconds is closed.
+
+    A session is only returned to the pool if it was used without a connection error or a timeout, so a session to a
+    device that has stopped answering is never handed out again.
+    """
+
+    def __init__(self, max_size=SNMP_POOL_MAX_SIZE, max_idle=SNMP_POOL_MAX_IDLE):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        # key -> list of (session, time it was returned to the pool), with the most recently used key last
+        self._idle = OrderedDict()
+
+    @contextmanager
+    def session(self, hostname, community, version=2, timeout=2, retries=3):
+        """
+        Use as 'with pool.session(...) as session:'. Gives out an idle session with the same settings if there is one,
+        or creates a new session.
+        """
+        key = (hostname, community, version, timeout, retries)
+
+        session = self._checkout(key)
+
+        if session is None:
+            session = Session(hostname=hostname, community=community, version=version, timeout=timeout,
+                              retries=retries)
+
+        try:
+            yield session
+        except (exceptions.EasySNMPConnectionError, exceptions.EasySNMPTimeoutError):
+            # Failed the health check, so the session is dropped rather than returned
+            raise
+        except Exception:
+            # Anything else (eg. noAccess when setting a value) is nothing to do with the session itself
+            self._checkin(key, session)
+            raise
+        else:
+            self._checkin(key, session)
+
+    def reap(self):
+        """
+        Closes every session that has been idle for longer than max_idle seconds.
+        """
+        with self._lock:
+            self._reap(time.time())
+
+    def _checkout(self, key):
+        with self._lock:
+            self._reap(time.time())
+
+            sessions = self._idle.get(key)
+
+            if not sessions:
+                return None
+
+            session, returned = sessions.pop()
+
+            if not sessions:
+                del self._idle[key]
+
+            return session
+
+    def _checkin(self, key, session):
+        with self._lock:
+            self._idle.setdefault(key, []).append((session, time.time()))
+            self._idle.move_to_end(key)
+
+            # Close the least recently used sessions if there are too many
+            while sum(len(sessions) for sessions in self._idle.values()) > self.max_size:
+                oldest = next(iter(self._idle))
+                self._idle[oldest].pop(0)
+
+                if not self._idle[oldest]:
+                    del self._idle[oldest]
+
+    def _reap(self, now):
+        for key in list(self._idle):
+            sessions = [(session, returned) for session, returned in self._idle[key]
+                        if now - returned <= self.max_idle]
+
+            if sessions:
+                self._idle[key] = sessions
+            else:
+                del self._idle[key]
+
+
+# The pool shared by everything in this process
+session_pool = SessionPool()
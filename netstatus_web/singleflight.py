@@ -0,0 +1,97 @@
+import threading
+import time
+import uuid
+
+from django.db import IntegrityError, OperationalError, transaction
+
+from .models import RefreshLock
+
+from netstatus.settings import REFRESH_LOCK_LEASE
+
+# How often (in seconds) a request waiting for a refresh in another process checks whether it has finished
+POLL_INTERVAL = 0.25
+
+# Name -> event set when the refresh of that name running in this process finishes
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight(name, refresh, wait):
+    """
+    Runs refresh(renew) as the refresh called name, unless that refresh is already running in another thread or process,
+    in which case this waits up to wait seconds for it to finish instead of running it again.
+
+    Threads in the same process wait on an event, so they carry on as soon as the refresh is done. Across processes,
+    a lease is taken out in the RefreshLock table; a process that finds the lease taken polls until it is released.
+    A lease that isn't released within REFRESH_LOCK_LEASE seconds (eg. the process holding it was killed) is
+    treated as abandoned. The refresh should call renew() whenever it makes progress, which extends the lease by
+    another REFRESH_LOCK_LEASE seconds, so a long refresh that is still getting through its work isn't.
+
+    Returns True if refresh() was run here, or False if this waited for someone else's refresh (or gave up waiting).
+    """
+    with _flights_lock:
+        flight = _flights.get(name)
+        leader = flight is None
+
+        if leader:
+            flight = _flights[name] = threading.Event()
+
+    if not leader:
+        flight.wait(wait)
+        return False
+
+    try:
+        owner = uuid.uuid4().hex
+        deadline = time.time() + wait
+
+        while not _acquire(name, owner):
+            if time.time() >= deadline:
+                return False
+
+            time.sleep(POLL_INTERVAL)
+
+            if not RefreshLock.objects.filter(name=name).exists():
+                # The other process has finished, so there is nothing left to refresh
+                return False
+
+        try:
+            refresh(lambda: _renew(name, owner))
+        finally:
+            RefreshLock.objects.filter(name=name, owner=owner).delete()
+
+        return True
+    finally:
+        with _flights_lock:
+            del _flights[name]
+
+        flight.set()
+
+
+def _acquire(name, owner):
+    """
+    Takes out the lease called name, returning False if someone else holds it, or the database is too busy to tell
+    (eg. SQLite's "database is locked" while another process is writing to it).
+    """
+    now = time.time()
+
+    try:
+        # Clear a lease that has been abandoned
+        RefreshLock.objects.filter(name=name, expires__lt=now).delete()
+
+        with transaction.atomic():
+            RefreshLock.objects.create(name=name, owner=owner, expires=now + REFRESH_LOCK_LEASE)
+    except (IntegrityError, OperationalError):
+        return False
+
+    return True
+
+
+def _renew(name, owner):
+    """
+    Extends the lease called name, as long as owner still holds it. If the database is too busy, the lease is
+    extended the next time instead.
+    """
+    try:
+        RefreshLock.objects.filter(name=name, owner=owner).update(expires=time.time() + REFRESH_LOCK_LEASE)
+    except OperationalError:
+        pass
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from django.core.cache import cache
+
+from .db import close_thread_connection
+
+# Threads used to refresh stale entries in the background, so a page never has to wait for a refresh
+_refresher = ThreadPoolExecutor(max_workers=4)
+
+# Keys being refreshed in the background by this process, so the same entry isn't refreshed several times at once
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def cached_snmp(key, fetch, ttl, max_stale, force=False):
+    """
+    Returns (value, time it was fetched) for information got from a device over SNMP, where fetch() gets the
+    information from the device. Uses Django's cache, so the same information isn't got from the device again and
+    again when a page is reloaded, or several people are looking at the same device.
+
+    - Information less than ttl seconds old is returned straight from the cache.
+    - Information older than that, but less than ttl + max_stale seconds old, is also returned straight from the
+      cache, but is refreshed in the background so the next request gets up to date information.
+    - Anything else, or if force is True, is fetched from the device before returning. Any exception fetch() raises
+      (eg. EasySNMPTimeoutError) is raised here.
+
+    A background refresh that fails is ignored, and the stale information is served until it is too old.
+    """
+    entry = None if force else cache.get(key)
+
+    if entry is None:
+        return _fetch(key, fetch, ttl, max_stale)
+
+    value, fetched = entry
+
+    if time.time() - fetched > ttl:
+        with _refreshing_lock:
+            start = key not in _refreshing
+            _refreshing.add(key)
+
+        if start:
+            _refresher.submit(_refresh, key, fetch, ttl, max_stale)
+
+    return value, fetched
+
+
+def _fetch(key, fetch, ttl, max_stale):
+    value = fetch()
+    fetched = time.time()
+
+    cache.set(key, (value, fetched), ttl + max_stale)
+
+    return value, fetched
+
+
+def _refresh(key, fetch, ttl, max_stale):
+    try:
+        _fetch(key, fetch, ttl, max_stale)
+    except Exception:
+        pass
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+        # fetch() may have used the database
+        close_thread_connection()
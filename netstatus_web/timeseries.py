@@ -0,0 +1,204 @@
+import os
+
+import numpy as np
+
+from netstatus.settings import TIMESERIES_DIR, TIMESERIES_SLOTS, TIMESERIES_PORTS
+
+# The interface counters stored for every port, in the order they are stored in
+COUNTERS = ('in_octets', 'out_octets', 'in_errors', 'out_errors', 'in_discards', 'out_discards')
+
+# Stored in place of a counter the device didn't return
+MISSING = np.iinfo(np.uint64).max
+
+# Identifies a counter store file, and the version of its layout
+MAGIC = 0x4e53545331  # "NSTS1"
+VERSION = 1
+
+# Header fields: magic, version, slots, ports, counters, next slot to write, number of samples stored, unused
+HEADER_SIZE = 8
+HEAD, COUNT = 5, 6
+
+
+class CounterStore(object):
+    """
+    A fixed size, round robin store of interface counter samples for one device, kept in a memory mapped file so that
+    it never has to be read into memory as a whole.
+
+    The file holds a small header, the ifIndex of the port stored in each column, and then 'slots' samples, each
+    being a timestamp and a (ports x counters) array of unsigned 64-bit counter values. Once every slot has been
+    used, each new sample replaces the oldest one, so the file never grows.
+
+    Only one process (the poller) should append to a store, but any number can read it at the same time.
+    """
+
+    def __init__(self, path, slots=TIMESERIES_SLOTS, ports=TIMESERIES_PORTS, readonly=False):
+        """
+        Opens the store at path, creating it with room for 'slots' samples of 'ports' ports if it doesn't exist (and
+        readonly is False). An existing store keeps the size it was created with.
+        """
+        exists = os.path.exists(path)
+
+        if not exists and readonly:
+            raise IOError("No counter store at {0}".format(path))
+
+        if exists:
+            header = np.memmap(path, dtype=np.int64, mode='r', shape=(HEADER_SIZE,))
+
+            if header[0] != MAGIC or header[1] != VERSION or header[4] != len(COUNTERS):
+                raise ValueError("{0} isn't a counter store".format(path))
+
+            slots, ports = int(header[2]), int(header[3])
+            del header
+        else:
+            # Make the whole file up front, so it never has to grow. Unused space doesn't take up any disk space on
+            # most filesystems until it is written.
+            with open(path, 'wb') as store:
+                store.truncate(8 * (HEADER_SIZE + ports + slots + slots * ports * len(COUNTERS)))
+
+        self.path = path
+        self.slots = slots
+        self.max_ports = ports
+
+        mode = 'r' if readonly else 'r+'
+
+        offset = 0
+        self._header = np.memmap(path, dtype=np.int64, mode=mode, shape=(HEADER_SIZE,))
+        offset += self._header.nbytes
+
+        # ifIndex of the port stored in each column, or -1 for a column that hasn't been used yet
+        self._ifindex = np.memmap(path, dtype=np.int64, mode=mode, offset=offset, shape=(ports,))
+        offset += self._ifindex.nbytes
+
+        self._timestamps = np.memmap(path, dtype=np.int64, mode=mode, offset=offset, shape=(slots,))
+        offset += self._timestamps.nbytes
+
+        self._counters = np.memmap(path, dtype=np.uint64, mode=mode, offset=offset,
+                                   shape=(slots, ports, len(COUNTERS)))
+
+        if not exists:
+            self._header[:] = (MAGIC, VERSION, slots, ports, len(COUNTERS), 0, 0, 0)
+            self._ifindex[:] = -1
+            self.flush()
+
+        self._columns = dict((int(ifindex), column) for column, ifindex in enumerate(self._ifindex) if ifindex >= 0)
+
+    @property
+    def ports(self):
+        """
+        The ifIndex of every port stored, in column order.
+        """
+        return sorted(self._columns, key=self._columns.get)
+
+    def __len__(self):
+        return int(self._header[COUNT])
+
+    def append(self, timestamp, counters):
+        """
+        Stores a sample taken at timestamp (a Unix timestamp), where counters is a dictionary of ifIndex -> sequence
+        of counter values in the order of COUNTERS (None for a counter the device didn't return). Samples must be
+        appended in time order.
+
+        A port that hasn't been seen before is given the next unused column, in ifIndex order. Ports that don't fit in
+        the store are left out, and their ifIndexes are returned.
+        """
+        head = int(self._header[HEAD])
+
+        sample = np.full(self._counters.shape[1:], MISSING, dtype=np.uint64)
+        dropped = []
+
+        for ifindex, values in sorted(counters.items()):
+            column = self._columns.get(ifindex)
+
+            if column is None:
+                if len(self._columns) == len(self._ifindex):
+                    dropped.append(ifindex)
+                    continue
+
+                column = self._columns[ifindex] = len(self._columns)
+                self._ifindex[column] = ifindex
+
+            sample[column] = [MISSING if value is None else value for value in values]
+
+        # The sample is written before the header is moved on, so a reader never sees a slot that is half written
+        self._counters[head] = sample
+        self._timestamps[head] = timestamp
+        self._header[COUNT] = min(self.slots, int(self._header[COUNT]) + 1)
+        self._header[HEAD] = (head + 1) % self.slots
+
+        return dropped
+
+    def segments(self, start=None, end=None):
+        """
+        Returns the samples taken from start to end (Unix timestamps, inclusive, or None for no limit) as a list of
+        (timestamps, counters) pairs in time order, where timestamps is a 1 dimensional array and counters a
+        (samples x ports x counters) array, with the ports in the same order as the ports property.
+
+        These are views of the memory mapped file rather than copies, so reading a range costs nothing up front. As the
+        store is a ring, a range that crosses the point where the oldest samples are being replaced comes back as two
+        segments; use read for a single (copied) array instead.
+        """
+        head = int(self._header[HEAD])
+        count = len(self)
+        ports = len(self._columns)
+
+        if count < self.slots:
+            ranges = [(0, count)]
+        else:
+            ranges = [(head, self.slots), (0, head)]
+
+        segments = []
+
+        for first, last in ranges:
+            timestamps = self._timestamps[first:last]
+
+            # Timestamps are in order within each contiguous range, so the range can be found by binary search
+            low = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+            high = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+
+            if low < high:
+                segments.append((timestamps[low:high], self._counters[first + low:first + high, :ports]))
+
+        return segments
+
+    def read(self, start=None, end=None):
+        """
+        Returns the samples taken from start to end as a single (timestamps, counters) pair, see segments. This is
+        only a copy if the range crosses the point where the oldest samples are being replaced.
+        """
+        segments = self.segments(start, end)
+
+        if len(segments) == 1:
+            return segments[0]
+
+        if not segments:
+            return (np.empty(0, dtype=np.int64),
+                    np.empty((0, len(self._columns), len(COUNTERS)), dtype=np.uint64))
+
+        return (np.concatenate([timestamps for timestamps, counters in segments]),
+                np.concatenate([counters for timestamps, counters in segments]))
+
+    def flush(self):
+        """
+        Writes any changes out to the file.
+        """
+        for array in (self._counters, self._timestamps, self._ifindex, self._header):
+            if array.mode != 'r':
+                array.flush()
+
+
+def store_path(device_id):
+    """
+    Returns the path of the counter store of a device.
+    """
+    return os.path.join(TIMESERIES_DIR, "{0}.counters".format(device_id))
+
+
+def open_store(device_id, readonly=False):
+    """
+    Opens the counter store of a device, creating it (and TIMESERIES_DIR) if it doesn't exist yet, unless readonly is
+    True, in which case IOError is raised.
+    """
+    if not readonly and not os.path.isdir(TIMESERIES_DIR):
+        os.makedirs(TIMESERIES_DIR)
+
+    return CounterStore(store_path(device_id), readonly=readonly)
@@ -0,0 +1,306 @@
+from collections import namedtuple
+import socket
+
+# Just enough of BER (the encoding SNMP messages use) to read SNMPv1 and v2c traps and informs, answer informs, and
+# send test traps. EasySNMP can only send requests, not receive notifications.
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+IP_ADDRESS = 0x40
+COUNTER32 = 0x41
+GAUGE32 = 0x42
+TIME_TICKS = 0x43
+COUNTER64 = 0x46
+
+# PDU types
+RESPONSE = 0xa2
+TRAP_V1 = 0xa4
+INFORM = 0xa6
+TRAP_V2 = 0xa7
+
+VERSION_1 = 0
+VERSION_2C = 1
+
+# Varbinds every v2c notification starts with, and the address of the agent a notification came from when it has been
+# passed on by a proxy
+SYS_UP_TIME = '1.3.6.1.2.1.1.3.0'
+SNMP_TRAP_OID = '1.3.6.1.6.3.1.1.4.1.0'
+SNMP_TRAP_ADDRESS = '1.3.6.1.6.3.18.1.3.0'
+
+# Notifications NetStatus acts on
+COLD_START = '1.3.6.1.6.3.1.1.5.1'
+WARM_START = '1.3.6.1.6.3.1.1.5.2'
+LINK_DOWN = '1.3.6.1.6.3.1.1.5.3'
+LINK_UP = '1.3.6.1.6.3.1.1.5.4'
+LLDP_REM_TABLES_CHANGE = '1.0.8802.1.1.2.0.0.1'
+
+# ifIndex, the index of the port a linkUp/linkDown is about
+IF_INDEX = '1.3.6.1.2.1.2.2.1.1'
+
+# varbind_list is the varbinds as they were encoded, to send back in the response to an inform
+Notification = namedtuple('Notification', ['version', 'community', 'pdu_type', 'request_id', 'agent_address',
+                                           'trap_oid', 'varbinds', 'varbind_list'])
+
+
+class TrapDecodeError(ValueError):
+    """
+    Raised when a datagram isn't an SNMP notification that can be read.
+    """
+
+
+def _decode_length(data, offset):
+    length = data[offset]
+    offset += 1
+
+    if length & 0x80:
+        size = length & 0x7f
+
+        if not 0 < size <= 4 or offset + size > len(data):
+            raise TrapDecodeError("Bad length")
+
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+
+    return length, offset
+
+
+def _decode(data, offset=0):
+    """
+    Reads the item at offset, returning (tag, value bytes, offset of the next item).
+    """
+    if offset + 2 > len(data):
+        raise TrapDecodeError("Truncated message")
+
+    tag = data[offset]
+    length, start = _decode_length(data, offset + 1)
+
+    if start + length > len(data):
+        raise TrapDecodeError("Truncated message")
+
+    return tag, data[start:start + length], start + length
+
+
+def _decode_items(data):
+    """
+    Returns the (tag, value bytes) of every item in the contents of a SEQUENCE or PDU.
+    """
+    items = []
+    offset = 0
+
+    while offset < len(data):
+        tag, value, offset = _decode(data, offset)
+        items.append((tag, value))
+
+    return items
+
+
+def _decode_oid(value):
+    if not value:
+        raise TrapDecodeError("Empty OID")
+
+    parts = list(divmod(value[0], 40)) if value[0] < 80 else [2, value[0] - 80]
+    number = 0
+
+    for byte in value[1:]:
+        number = (number << 7) | (byte & 0x7f)
+
+        if not byte & 0x80:
+            parts.append(number)
+            number = 0
+
+    return ".".join(str(part) for part in parts)
+
+
+def _decode_value(tag, value):
+    """
+    Turns a varbind value into a Python value: an int, a string for an OID or IP address, bytes for an OCTET STRING, or
+    None.
+    """
+    if tag == INTEGER:
+        return int.from_bytes(value, 'big', signed=True)
+
+    if tag in (COUNTER32, GAUGE32, TIME_TICKS, COUNTER64):
+        return int.from_bytes(value, 'big')
+
+    if tag == OBJECT_IDENTIFIER:
+        return _decode_oid(value)
+
+    if tag == IP_ADDRESS:
+        return socket.inet_ntoa(value) if len(value) == 4 else None
+
+    if tag == OCTET_STRING:
+        return bytes(value)
+
+    return None
+
+
+def _decode_message(data):
+    """
+    Reads the version, community, PDU type and PDU fields (as (tag, value bytes)) of an SNMP message.
+    """
+    tag, message, end = _decode(data)
+
+    if tag != SEQUENCE:
+        raise TrapDecodeError("Not an SNMP message")
+
+    items = _decode_items(message)
+
+    if len(items) != 3 or items[0][0] != INTEGER or items[1][0] != OCTET_STRING:
+        raise TrapDecodeError("Not an SNMP message")
+
+    pdu_type, pdu = items[2]
+
+    return _decode_value(*items[0]), items[1][1].decode('utf-8', 'replace'), pdu_type, _decode_items(pdu)
+
+
+def decode_notification(data):
+    """
+    Reads an SNMPv1 trap, or an SNMPv2c trap or inform, from a datagram, returning a Notification. The trap_oid of a v1
+    trap is worked out from its generic and specific trap numbers (see RFC 3584), so the notification can be handled
+    the same whichever version it was sent as. Raises TrapDecodeError if it isn't one of these.
+    """
+    try:
+        version, community, pdu_type, fields = _decode_message(data)
+
+        if version == VERSION_1 and pdu_type == TRAP_V1 and len(fields) == 6:
+            enterprise, agent_address, generic, specific, uptime = [_decode_value(*field) for field in fields[:5]]
+            varbinds = _decode_varbinds(fields[5][1])
+
+            if generic == 6:
+                trap_oid = "{0}.0.{1}".format(enterprise, specific)
+            else:
+                trap_oid = "1.3.6.1.6.3.1.1.5.{0}".format(generic + 1)
+
+            return Notification(version, community, pdu_type, None, agent_address, trap_oid, varbinds, fields[5][1])
+
+        if version == VERSION_2C and pdu_type in (TRAP_V2, INFORM) and len(fields) == 4:
+            request_id = _decode_value(*fields[0])
+            varbinds = _decode_varbinds(fields[3][1])
+            values = dict(varbinds)
+
+            return Notification(version, community, pdu_type, request_id, values.get(SNMP_TRAP_ADDRESS),
+                                values.get(SNMP_TRAP_OID), varbinds, fields[3][1])
+    except TrapDecodeError:
+        raise
+    except (IndexError, ValueError, UnicodeDecodeError):
+        raise TrapDecodeError("Malformed message")
+
+    raise TrapDecodeError("Not a notification")
+
+
+def decode_response_id(data):
+    """
+    Returns the request ID of a response (eg. the answer to an inform), raising TrapDecodeError if data isn't one.
+    """
+    try:
+        version, community, pdu_type, fields = _decode_message(data)
+
+        if pdu_type == RESPONSE and fields and fields[0][0] == INTEGER:
+            return _decode_value(*fields[0])
+    except TrapDecodeError:
+        raise
+    except (IndexError, ValueError, UnicodeDecodeError):
+        raise TrapDecodeError("Malformed message")
+
+    raise TrapDecodeError("Not a response")
+
+
+def _decode_varbinds(data):
+    varbinds = []
+
+    for tag, varbind in _decode_items(data):
+        (name_tag, name), (value_tag, value) = _decode_items(varbind)
+        varbinds.append((_decode_oid(name), _decode_value(value_tag, value)))
+
+    return varbinds
+
+
+def _encode(tag, value):
+    length = len(value)
+
+    if length < 0x80:
+        header = bytes([tag, length])
+    else:
+        size = (length.bit_length() + 7) // 8
+        header = bytes([tag, 0x80 | size]) + length.to_bytes(size, 'big')
+
+    return header + value
+
+
+def _encode_integer(tag, number):
+    size = max(1, (number.bit_length() + 8) // 8)
+
+    if tag != INTEGER:
+        # Unsigned types still need a leading 0 byte if the top bit is set
+        return _encode(tag, number.to_bytes(size, 'big'))
+
+    return _encode(tag, number.to_bytes(size, 'big', signed=True))
+
+
+def _encode_oid(oid):
+    parts = [int(part) for part in oid.strip(".").split(".")]
+    encoded = bytearray([parts[0] * 40 + parts[1]])
+
+    for part in parts[2:]:
+        chunk = [part & 0x7f]
+        part >>= 7
+
+        while part:
+            chunk.append(0x80 | (part & 0x7f))
+            part >>= 7
+
+        encoded.extend(reversed(chunk))
+
+    return _encode(OBJECT_IDENTIFIER, bytes(encoded))
+
+
+def _encode_value(value):
+    """
+    Encodes a varbind value: an int as an INTEGER, a (tag, value) pair as that type (an IP address string for
+    IP_ADDRESS, otherwise an unsigned int), a string as an OID, bytes as an OCTET STRING and None as NULL.
+    """
+    if value is None:
+        return _encode(NULL, b'')
+
+    if isinstance(value, tuple):
+        tag, value = value
+
+        if tag == IP_ADDRESS:
+            return _encode(IP_ADDRESS, socket.inet_aton(value))
+
+        return _encode_integer(tag, value)
+
+    if isinstance(value, int):
+        return _encode_integer(INTEGER, value)
+
+    if isinstance(value, bytes):
+        return _encode(OCTET_STRING, value)
+
+    return _encode_oid(value)
+
+
+def _encode_message(community, pdu_type, request_id, varbind_list):
+    pdu = _encode(pdu_type, _encode_integer(INTEGER, request_id) + _encode_integer(INTEGER, 0) +
+                  _encode_integer(INTEGER, 0) + _encode(SEQUENCE, varbind_list))
+
+    return _encode(SEQUENCE, _encode_integer(INTEGER, VERSION_2C) + _encode(OCTET_STRING, community.encode('utf-8')) +
+                   pdu)
+
+
+def encode_notification(community, pdu_type, request_id, varbinds):
+    """
+    Builds an SNMPv2c trap or inform with the given varbinds, a list of (OID, value) pairs (see _encode_value for the
+    values allowed).
+    """
+    varbind_list = b''.join(_encode(SEQUENCE, _encode_oid(name) + _encode_value(value)) for name, value in varbinds)
+
+    return _encode_message(community, pdu_type, request_id, varbind_list)
+
+
+def encode_inform_response(notification):
+    """
+    Builds the response an agent needs to stop resending an inform: the same request ID and varbinds, with no error.
+    """
+    return _encode_message(notification.community, RESPONSE, notification.request_id, notification.varbind_list)
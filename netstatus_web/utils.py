@@ -1,17 +1,31 @@
 from django.shortcuts import render, Http404, HttpResponse
 
 import base64
-from easysnmp import Session
 from easysnmp import exceptions
 import binascii
-from subprocess import check_output, CalledProcessError
-import re
-from .models import MACtoPort, IgnoredPort
-import sys
-
-from netstatus.settings import SNMP_COMMUNITY_R, SNMP_COMMUNITY_RW
-
-def ping(ip):
+import socket
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.db import IntegrityError, transaction
+from django.db.models import FloatField, Max, PositiveSmallIntegerField, Q
+from .models import Device, MACtoPort, IgnoredPort, ArpEntry, LogEntry, StatusEvent
+from .collector import collect
+from .db import batches, update_each
+from .sessions import session_pool
+from .health import device_health, DeviceBackoffError
+from .macaddr import mac_to_int, int_to_mac, int_to_decimal
+from .walks import parse_fdb_walk, parse_lldp_walk, parse_arp_walk, log_row_index
+from .rtt import next_rtt_state
+from .singleflight import single_flight
+from .traps import COLD_START, WARM_START, LINK_UP, LINK_DOWN, LLDP_REM_TABLES_CHANGE
+import time
+
+from netstatus.settings import SNMP_COMMUNITY_R, SNMP_COMMUNITY_RW, PING_CONCURRENCY, CORE_SWITCH_IPV4, ARP_ROUTERS, \
+    ARP_CACHE_MAX_AGE, SNMP_MAX_REPETITIONS, SNMP_TIMEOUT_INITIAL, SNMP_RETRIES_INITIAL, MAC_TO_PORT_MAX_AGE, \
+    IGNORED_PORT_MAX_AGE, REFRESH_LOCK_WAIT, SNMP_TRAP_PROXIES
+
+def ping(ip, timeout=SNMP_TIMEOUT_INITIAL, retries=SNMP_RETRIES_INITIAL):
     """
     'Pings' a specified IP address to check if it is online or not.
      Returns True if online, False if offline.
@@ -19,21 +33,212 @@ def ping(ip):
      True means that an SNMP session has successfuly been established and the system description has been got.
      False means that an SNMP session could not be established - however, the device may still actually be online.
      For my purposes, if a device does not establish an SNNP session, I can assume it is offline.
+
+     The timeout and retries of a device that is being tracked should be its own (Device.snmp_timeout and
+     Device.snmp_retries), so that a slow device isn't given up on too soon and a fast one isn't waited on too long.
     """
     try:
-        # The low timeout value is to decrease page loading time, as this is mainly for quickly checking
-        # device status. We don't NEED to make a connection.
-        session = Session(hostname=ip, community=SNMP_COMMUNITY_R, version=2, timeout=0.1)
-    except (exceptions.EasySNMPTimeoutError, exceptions.EasySNMPConnectionError):
+        return round_trip_time(ip, timeout, retries) is not None
+    except DeviceBackoffError:
         return False
 
+
+def round_trip_time(ip, timeout=SNMP_TIMEOUT_INITIAL, retries=SNMP_RETRIES_INITIAL):
+    """
+    'Pings' a specified IP address in the same way as 'ping', but returns how long (in seconds) the device took to
+    answer, or None if it didn't answer.
+
+    Raises DeviceBackoffError if the device is being backed off from (see health.py), as then nothing was sent and it
+    is neither known to be offline nor how long it would have taken.
+    """
     try:
-        # Try and get sysDescr.0 from the device. It doesn't matter which element we choose, just that we can actually
-        # get one, as we might be able to establish a connection but not get
-        session.get('sysDescr.0')
-        return True
-    except exceptions.EasySNMPTimeoutError:
-        return False
+        with snmp_session(ip, community=SNMP_COMMUNITY_R, timeout=timeout, retries=retries) as session:
+            # Try and get sysDescr.0 from the device. It doesn't matter which element we choose, just that we can
+            # actually get one, as we might be able to establish a connection but not get
+            started = time.time()
+            session.get('sysDescr.0')
+            return time.time() - started
+    except DeviceBackoffError:
+        raise
+    except (exceptions.EasySNMPTimeoutError, exceptions.EasySNMPConnectionError):
+        return None
+
+
+def ping_many(device_list, concurrency=PING_CONCURRENCY, skipped=None):
+    """
+    'Pings' every device in a list at the same time, using a pool of threads and each device's own timeout and
+    retries. Returns a dictionary of device -> how long (in seconds) it took to answer, or None if it is offline.
+
+    A device being backed off from (see health.py) isn't contacted, and is treated as offline. If skipped is a list,
+    those devices are added to it.
+
+    An unreachable device costs a full timeout, so checking devices one after another would take (number of offline
+    devices x timeout). Checking them in parallel means a sweep takes roughly as long as the slowest device, as long
+    as there are no more devices than the concurrency limit.
+    """
+    device_list = list(device_list)
+
+    if not device_list:
+        return {}
+
+    backed_off = []
+
+    def fetch(device):
+        try:
+            return round_trip_time(device.ipv4_address, device.snmp_timeout, device.snmp_retries)
+        except DeviceBackoffError:
+            backed_off.append(device)
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(device_list))) as executor:
+        results = list(executor.map(fetch, device_list))
+
+    if skipped is not None:
+        skipped.extend(backed_off)
+
+    return dict(zip(device_list, results))
+
+
+def reachable_devices(device_list, progress=None):
+    """
+    Returns the devices in the list that can currently be contacted, leaving out the core switch (which has the MAC
+    address of every device on the network on almost every port, so isn't useful for finding devices).
+
+    If progress is given, progress(device) is called for every device that can't be contacted, as there is nothing
+    more to do with it.
+    """
+    device_list = [device for device in device_list if device.ipv4_address != CORE_SWITCH_IPV4]
+
+    status = ping_many(device_list)
+
+    if progress is not None:
+        for device in device_list:
+            if status[device] is None:
+                progress(device)
+
+    return [device for device in device_list if status[device] is not None]
+
+
+def update_device_status(device_list):
+    """
+    Checks whether every device in the list is online or offline by using the 'ping_many' function, and stores the
+    result in the database.
+
+    Rather than saving every device individually, the devices are split into online and offline groups and each group
+    is written with a single UPDATE query. Returns a tuple of the number of (online, offline) devices.
+
+    How long each device took to answer is also used to update its SNMP timeout and retries (see rtt.py), except for
+    devices that weren't contacted because they are being backed off from, which have nothing to learn from.
+    """
+    online_ids = []
+    offline_ids = []
+    skipped = []
+
+    status = ping_many(device_list, skipped=skipped)
+
+    for device, round_trip in status.items():
+        if round_trip is not None:
+            online_ids.append(device.id)
+        else:
+            offline_ids.append(device.id)
+
+    record_status_changes(online_ids, offline_ids)
+
+    store_round_trip_times(dict((device, round_trip) for device, round_trip in status.items()
+                                if device not in skipped))
+
+    return len(online_ids), len(offline_ids)
+
+
+def record_status_changes(online_ids, offline_ids):
+    """
+    Stores that the devices with the IDs in online_ids are online and those in offline_ids are offline. Only devices
+    whose state has changed are written, with when they changed, and a StatusEvent is recorded for each of them for
+    the device map. Returns the number of devices that changed.
+
+    The same few queries are made no matter how many devices there are.
+    """
+    now = int(time.time())
+
+    with transaction.atomic():
+        went_online = list(Device.objects.filter(id__in=online_ids, online=False).values_list('id', flat=True))
+        went_offline = list(Device.objects.filter(id__in=offline_ids, online=True).values_list('id', flat=True))
+
+        if went_online:
+            Device.objects.filter(id__in=went_online).update(online=True, status_changed=now)
+
+        if went_offline:
+            Device.objects.filter(id__in=went_offline).update(online=False, status_changed=now)
+
+        StatusEvent.objects.bulk_create([StatusEvent(device_id=device_id, online=True, time=now)
+                                         for device_id in went_online] +
+                                        [StatusEvent(device_id=device_id, online=False, time=now)
+                                         for device_id in went_offline])
+
+    return len(went_online) + len(went_offline)
+
+
+def handle_notification(notification, source_address):
+    """
+    Acts on an SNMP trap or inform (see traps.py) sent from source_address. Returns the device it came from, or None if
+    it isn't from a tracked device. A notification from this server or one of SNMP_TRAP_PROXIES may name the device
+    it came from (in snmpTrapAddress.0, or the agent address of a v1 trap).
+
+    Any notification from a device means it is up, so it is marked online (and the device map told, see
+    record_status_changes) without waiting for the next sweep. A device restarting (coldStart/warmStart) has lost its
+    MAC address and LLDP tables, a port going up or down (linkUp/linkDown) changes the MAC addresses learned on it, and
+    lldpRemTablesChange means the LLDP neighbours have changed, so the search results affected are marked as expired,
+    to be refreshed by the next search. A restart also clears the device's log, so its stored log entries are deleted.
+    """
+    # A notification passed on by a proxy says which agent it came from. That is only believed from the proxies that
+    # are trusted, otherwise anyone with the community could act for any device. A v1 agent that doesn't know its own
+    # address sends 0.0.0.0.
+    address = source_address
+
+    if source_address.startswith('127.') or source_address in SNMP_TRAP_PROXIES:
+        if notification.agent_address not in (None, '0.0.0.0'):
+            address = notification.agent_address
+
+    device = Device.objects.filter(ipv4_address=address).first()
+
+    if device is None:
+        return None
+
+    record_status_changes([device.id], [])
+
+    if notification.trap_oid in (COLD_START, WARM_START):
+        Device.objects.filter(id=device.id).update(mac_to_port_updated=0, ignored_port_updated=0)
+        # Its log has been reset too, and the new entries are numbered from 1 again (see walk_log_table)
+        LogEntry.objects.filter(device=device).delete()
+    elif notification.trap_oid in (LINK_UP, LINK_DOWN):
+        Device.objects.filter(id=device.id).update(mac_to_port_updated=0)
+    elif notification.trap_oid == LLDP_REM_TABLES_CHANGE:
+        Device.objects.filter(id=device.id).update(ignored_port_updated=0)
+
+    return device
+
+
+def store_round_trip_times(round_trip_times):
+    """
+    Updates the smoothed round trip time, timeout and retries of every device in a dictionary of device -> how long (in
+    seconds) it took to answer a 'ping', or None if it didn't answer.
+
+    Every device ends up with different values, so they are written with update_each rather than saved one at a time.
+    """
+    changes = []
+
+    for device, round_trip in round_trip_times.items():
+        state = next_rtt_state(device.snmp_srtt, device.snmp_rttvar, device.snmp_timeout, round_trip)
+
+        if state != (device.snmp_srtt, device.snmp_rttvar, device.snmp_timeout, device.snmp_retries):
+            device.snmp_srtt, device.snmp_rttvar, device.snmp_timeout, device.snmp_retries = state
+            changes.append(device)
+
+    output_fields = {'snmp_srtt': FloatField(), 'snmp_rttvar': FloatField(), 'snmp_timeout': FloatField(),
+                     'snmp_retries': PositiveSmallIntegerField()}
+
+    update_each(Device.objects, [(device.id, dict((name, getattr(device, name)) for name in output_fields))
+                                 for device in changes], output_fields)
 
 
 def timeticks_to_days(timeticks):
@@ -43,49 +248,357 @@ def timeticks_to_days(timeticks):
     return timeticks / 8640000
 
 
-def setup_snmp_session(ip):
+def device_session(device, community=SNMP_COMMUNITY_RW):
     """
-    Sets up an SNMP session with a device and returns this session.
+    Gets an SNMP session with a tracked device, using the device's own timeout and retries, in the same way as
+    'snmp_session'.
     """
-    session = Session(hostname=ip, community=SNMP_COMMUNITY_RW, version=2, timeout=2)
-    return session
+    return snmp_session(device.ipv4_address, community, device.snmp_timeout, device.snmp_retries)
 
 
-def get_mac_address(ip_address):
+@contextmanager
+def snmp_session(ip, community=SNMP_COMMUNITY_RW, timeout=SNMP_TIMEOUT_INITIAL, retries=SNMP_RETRIES_INITIAL):
     """
-    Uses the ARP MAC address table to get the MAC address for a specified IP address.
+    Gets an SNMP session with a device from the session pool, for use as 'with snmp_session(ip) as session:'.
+
+    The session is returned to the pool at the end of the with block, unless the device timed out or couldn't be
+    connected to, in which case it is thrown away and the next use sets up a new one.
+
+    Whether the device answered is recorded in device_health. A device that keeps failing is backed off from, and
+    DeviceBackoffError (a kind of EasySNMPTimeoutError) is raised straight away rather than waiting for it to time out.
     """
-    # Opens a new subprocess using the 'ping' command line utility. Pings the specified IP address once.
+    if not device_health.allow(ip):
+        raise DeviceBackoffError("Skipping {0}, which has stopped answering SNMP requests".format(ip))
+
     try:
-        # We have to do this as the ping binary location differs on OSX (Darwin) and Linux
-        if sys.platform == "linux" or sys.platform == "linux2":
-            ping_out = check_output(["/bin/ping", "-c 1", ip_address])
-        elif sys.platform == "darwin":
-            ping_out = check_output(["/sbin/ping", "-c 1", ip_address])
-    except CalledProcessError:
-        return "ERR_PING_FAIL"
-
-    # This means the MAC address is now in our arp table, so we can find it. Opens a new subprocess using the arp
-    # command line utility, passing the IP address as an argument, and gets its output so we can search through it.
+        with session_pool.session(ip, community, version=2, timeout=timeout, retries=retries) as session:
+            yield session
+    except (exceptions.EasySNMPTimeoutError, exceptions.EasySNMPConnectionError):
+        device_health.record_failure(ip)
+        raise
+
+    device_health.record_success(ip)
+
+
+def bulk_walk(session, oid, max_repetitions):
+    """
+    Gets every element under an OID (eg. a table) from a device, and returns them as a list of EasySNMP objects.
+
+    This uses SNMPv2 GETBULK requests, each of which returns up to max_repetitions elements, instead of the single
+    element returned by each GETNEXT request that session.walk uses, so a large table takes far fewer round trips.
+    Devices that reject GETBULK are walked with GETNEXT instead, as are devices with max_repetitions set to 0.
+    """
+    if max_repetitions:
+        try:
+            return session.bulkwalk(oid, max_repetitions=max_repetitions)
+        except exceptions.EasySNMPTimeoutError:
+            # The device isn't answering at all, so walking it with GETNEXT would only time out again
+            raise
+        except exceptions.EasySNMPError:
+            # The device returned an error to GETBULK, so fall back to GETNEXT
+            pass
+
+    return session.walk(oid)
+
+
+def walk_log_table(session, resume, max_repetitions):
+    """
+    Gets the entries of a device's RMON log table (logDescription, mib-2.16.9.2.1.4) that are newer than the ones
+    already stored, where resume is a dictionary of event index -> the highest log index stored for that event.
+    Returns a list of (event index, log index, description), or None if the device's log has been reset.
+
+    The table is read from the start with GETBULK requests (or GETNEXT, if max_repetitions is 0 or the device rejects
+    GETBULK), but as soon as an event whose entries are already stored is reached, the next request skips straight
+    past them. So each event costs one extra request, however many entries it has, rather than the whole log being got
+    every time.
+
+    The newest stored entry of each event is got again, to check that it is still there. If it isn't, the device has
+    restarted or cleared its log and is numbering its entries from 1 again, so the stored entries no longer say which
+    of its entries are new.
+    """
+    rows = []
+    cursor = '.1.3.6.1.2.1.16.9.2.1.4'
+    last = (0, 0)
+    checking = None
+
+    while True:
+        if max_repetitions:
+            try:
+                items = session.get_bulk([cursor], max_repetitions=max_repetitions)
+            except exceptions.EasySNMPTimeoutError:
+                raise
+            except exceptions.EasySNMPError:
+                # The device returned an error to GETBULK, so carry on from the same place with GETNEXT, as bulk_walk
+                # does
+                max_repetitions = 0
+                continue
+        else:
+            items = [session.get_next(cursor)]
+
+        if not items:
+            return rows
+
+        for item in items:
+            index = log_row_index(item)
+
+            if checking is not None:
+                if index != checking:
+                    return None
+
+                checking = None
+            elif index is None or index <= last:
+                # Gone past the end of the table (or the device isn't returning the entries in order, which would
+                # never end)
+                return rows
+
+            last = index
+
+            event_index, log_index = index
+            cursor = '.1.3.6.1.2.1.16.9.2.1.4.{0}.{1}'.format(event_index, log_index)
+
+            if log_index < resume.get(event_index, 0):
+                # Already stored, so carry on from the newest stored entry of this event, which has to be the next one
+                # returned
+                checking = (event_index, resume[event_index])
+                cursor = '.1.3.6.1.2.1.16.9.2.1.4.{0}.{1}'.format(event_index, resume[event_index] - 1)
+                break
+
+            if log_index > resume.get(event_index, 0):
+                rows.append((event_index, log_index, item.value))
+
+
+def update_log_entries(device, session):
+    """
+    Stores the entries in a device's log table that haven't been stored yet, using an SNMP session with the device.
+    Returns the number of entries added.
+
+    If the device's log has been reset (see walk_log_table), its stored entries are deleted and the whole log is got
+    again.
+    """
+    resume = dict(LogEntry.objects.filter(device=device).values('event_index').annotate(
+        Max('log_index')).values_list('event_index', 'log_index__max'))
+
+    rows = walk_log_table(session, resume, device.snmp_max_repetitions)
+
+    if rows is None:
+        LogEntry.objects.filter(device=device).delete()
+        rows = walk_log_table(session, {}, device.snmp_max_repetitions)
+
+    if not rows:
+        return 0
+
+    # Another fetch of the same device (eg. a refresh alongside the background one, or in another process) may have
+    # stored some of the same entries since the log was walked, so those are left out. If one stores them between
+    # checking and inserting, the insert fails and is tried again without them.
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                existing = set(LogEntry.objects.filter(device=device, log_index__gte=min(row[1] for row in rows))
+                               .values_list('event_index', 'log_index'))
+
+                new_rows = [row for row in rows if (row[0], row[1]) not in existing]
+
+                LogEntry.objects.bulk_create([LogEntry(device=device, event_index=event_index, log_index=log_index,
+                                                       description=description, severity=description[:1])
+                                              for event_index, log_index, description in new_rows])
+
+            return len(new_rows)
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def device_information(device):
+    """
+    Gets the system based attributes of a device for the device information page, and stores any new entries in its
+    log (see update_log_entries).
+
+    Returns a dictionary of OID -> OID value of the system items. Raises EasySNMPTimeoutError if the device doesn't
+    answer.
+    """
+    # Establish SNMP session with the device, and get a list of system items and any new log items from it
+    with device_session(device) as session:
+        system_items = bulk_walk(session, 'system', device.snmp_max_repetitions)
+        update_log_entries(device, session)
+
+    system_information = {}
+
+    # Iterate over this list and put the items in a dictionary with OID -> OID Value (the rest of the information has
+    # little use to us)
+    for i in system_items:
+        if i.oid != 'sysUpTimeInstance':
+            system_information[i.oid] = i.value
+        else:
+            # Convert the timeticks value of this OID to days so its easier for the user to read
+            system_information[i.oid] = int(timeticks_to_days(int(i.value)))
+
+    return system_information
+
+
+def walk_many(device_list, oid, done=None):
+    """
+    Walks the same OID on every device in the list at the same time.
+
+    Returns a dictionary of device -> the list of EasySNMP objects the walk returned, and a dictionary of device ->
+    exception for any device that couldn't be walked. A device that takes too long is treated the same as an
+    EasySNMP timeout.
+
+    done(device, walk, error) is called as soon as each device has been walked, see collect.
+    """
+    def fetch(device):
+        with device_session(device) as session:
+            return bulk_walk(session, oid, device.snmp_max_repetitions)
+
+    tables, failed = collect(device_list, fetch, done=done)
+
+    for device, error in failed.items():
+        if isinstance(error, asyncio.TimeoutError):
+            failed[device] = exceptions.EasySNMPTimeoutError("Timed out walking {0} on {1}".format(oid, device))
+
+    return tables, failed
+
+
+def read_arp_table():
+    """
+    Returns a dictionary of IPv4 address -> MAC address (as an integer) of the complete entries in the kernel's ARP
+    table, read straight from /proc/net/arp rather than by running the arp command. Returns an empty dictionary where
+    /proc/net/arp doesn't exist (eg. on OSX).
+    """
+    entries = {}
+
     try:
-        arp_out = check_output(["/usr/sbin/arp", "-n", ip_address])
-    except CalledProcessError:
+        with open("/proc/net/arp") as arp_table:
+            # Skip the heading line. Each line is: IP address, HW type, Flags, HW address, Mask, Device
+            lines = arp_table.readlines()[1:]
+    except (IOError, OSError):
+        return entries
+
+    for line in lines:
+        fields = line.split()
+
+        # Flags of 0x0 mean the entry is incomplete, ie. the device didn't answer
+        if len(fields) >= 4 and int(fields[2], 16) != 0:
+            try:
+                entries[fields[0]] = mac_to_int(fields[3])
+            except ValueError:
+                pass
+
+    return entries
+
+
+def harvest_arp_cache(routers=ARP_ROUTERS):
+    """
+    Replaces the ArpEntry cache with the ARP tables of the routers, so that devices anywhere on the network (not just
+    on the same segment as this server) can be resolved without contacting them.
+
+    Both the older ipNetToMediaPhysAddress and the newer ipNetToPhysicalPhysAddress tables are read with GETBULK,
+    as routers may only support one of them. Returns the number of entries cached.
+    """
+    # Routers that are tracked by NetStatus use their own GETBULK, timeout and retries settings
+    router_settings = dict((device[0], device[1:]) for device in Device.objects.filter(
+        ipv4_address__in=routers).values_list('ipv4_address', 'snmp_max_repetitions', 'snmp_timeout', 'snmp_retries'))
+
+    def fetch(router):
+        max_repetitions, timeout, retries = router_settings.get(
+            router, (SNMP_MAX_REPETITIONS, SNMP_TIMEOUT_INITIAL, SNMP_RETRIES_INITIAL))
+
+        entries = {}
+
+        with snmp_session(router, timeout=timeout, retries=retries) as session:
+            for oid, inet_address in (('1.3.6.1.2.1.4.22.1.2', False), ('1.3.6.1.2.1.4.35.1.4', True)):
+                walk = bulk_walk(session, oid, max_repetitions)
+                entries.update(parse_arp_walk(walk, inet_address))
+
+        return entries
+
+    tables, failed = collect(routers, fetch)
+
+    # Don't empty the cache just because the routers couldn't be contacted this time
+    if not tables:
+        return 0
+
+    entries = {}
+    for table in tables.values():
+        entries.update(table)
+
+    now = int(time.time())
+
+    with transaction.atomic():
+        ArpEntry.objects.all().delete()
+        ArpEntry.objects.bulk_create([ArpEntry(ipv4_address=ip, mac_address=mac_address, updated=now)
+                                      for ip, mac_address in entries.items()])
+
+    return len(entries)
+
+
+def get_mac_address(ip_address):
+    """
+    Gets the MAC address for a specified IP address, as a 12 character hexadecimal string, without running any
+    other programs. Returns "ERR_ARP_FAIL" if the MAC address couldn't be found. See get_mac_addresses.
+    """
+    mac_address = get_mac_addresses([ip_address]).get(ip_address)
+
+    if mac_address is None:
         return "ERR_ARP_FAIL"
 
-    # Uses a regular expression to search for the MAC address in the ARP output.
-    mac = re.search("([a-fA-F0-9]{2}:){5}([a-fA-F0-9]{2})", str(arp_out))
+    # The HP switches used on the network don't use colon delimited MAC addresses in their output
+    return int_to_mac(mac_address)
+
+
+def get_mac_addresses(ip_addresses):
+    """
+    Gets the MAC addresses of several IP addresses at once, without running any other programs. Returns a dictionary
+    of IP address -> MAC address (as an integer), leaving out any IP address whose MAC address couldn't be found.
+
+    The ARP tables harvested from the routers are checked first, and then the kernel's own ARP table. Every IP
+    address that neither has is sent a single UDP packet, which makes the kernel look up its MAC address, and the
+    kernel's ARP table is checked again (for up to a second in total, however many addresses there are). This only
+    works for devices on the same network segment as this server.
+    """
+    ip_addresses = list(set(ip_addresses))
+    found = {}
+
+    for batch in batches(ip_addresses):
+        found.update(ArpEntry.objects.filter(ipv4_address__in=batch, updated__gte=int(time.time()) - ARP_CACHE_MAX_AGE)
+                     .values_list('ipv4_address', 'mac_address'))
+
+    missing = [ip_address for ip_address in ip_addresses if ip_address not in found]
+
+    if not missing:
+        return found
 
-    if mac is None:
-        return "ERR_MALFORMED_MAC"
+    arp_table = read_arp_table()
+    found.update((ip_address, arp_table[ip_address]) for ip_address in missing if ip_address in arp_table)
+    missing = [ip_address for ip_address in missing if ip_address not in found]
 
-    # Gets what the regex search found
-    mac_to_find = mac.group(0)
+    if not missing:
+        return found
 
-    # Replaces colons in the output, as the HP switches used on the network don't use colon delimited MAC addresses in
-    # their output
-    mac_to_find = mac_to_find.replace(":", "")
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probing = []
 
-    return mac_to_find
+    for ip_address in missing:
+        try:
+            # Port 9 is the discard service. It doesn't matter whether anything is listening, only that the kernel
+            # has to find the MAC address of the device to send the packet.
+            probe.sendto(b'', (ip_address, 9))
+            probing.append(ip_address)
+        except (socket.error, OverflowError):
+            pass
+
+    probe.close()
+
+    # Give the devices a moment to answer the ARP requests
+    for attempt in range(10):
+        if not probing:
+            break
+
+        time.sleep(0.1)
+        arp_table = read_arp_table()
+        found.update((ip_address, arp_table[ip_address]) for ip_address in probing if ip_address in arp_table)
+        probing = [ip_address for ip_address in probing if ip_address not in found]
+
+    return found
 
 
 def port_ignore_list(device):
@@ -97,55 +610,223 @@ def port_ignore_list(device):
     return port_list
 
 
-def update_ignored_ports(device_list):
+def store_ignored_ports(device, lldp_output):
+    """
+    Replaces the IgnoredPort entries of a device with the ports in its LLDP output, and records when this was done.
+
+    The new entries are written with a bulk insert in a single transaction, rather than running a query and an INSERT
+    for every row of the LLDP output. Entries belonging to other devices are left alone.
+    """
+    # The whole OID is returned. Becuase we only want the port, which is actually a part of the OID itself, the port
+    # is picked out of the OID of every element in the LLDP output.
+    new_ports = parse_lldp_walk(lldp_output)
+
+    with transaction.atomic():
+        IgnoredPort.objects.filter(device=device).delete()
+        IgnoredPort.objects.bulk_create([IgnoredPort(device=device, port=port) for port in sorted(new_ports)])
+        Device.objects.filter(id=device.id).update(ignored_port_updated=int(time.time()))
+
+
+def store_mac_to_port(device, port_address_table):
+    """
+    Replaces the MACtoPort entries of a device with every item in its port table, as long as the port isn't being
+    ignored, and records when this was done. Entries belonging to other devices are left alone.
+
+    The ignored ports are loaded once into a set, and the entries are written with bulk inserts in a single transaction
+    (Django splits these into batches small enough for the database), so storing a switch's table takes a handful of
+    queries however many MAC addresses it has learned.
+    """
+    ignored = set(port_ignore_list(device))
+
+    # Each item's OID contains the MAC address and its value is the port itself. These are decoded for the whole table
+    # at once into integer MAC addresses and ports.
+    mac_addresses, ports = parse_fdb_walk(port_address_table)
+
+    # Add a new object for every MAC address that is not on a port in our ignore list
+    entries = [MACtoPort(device=device, mac_address=mac_address, port=port)
+               for mac_address, port in zip(mac_addresses, ports) if port not in ignored]
+
+    publish_mac_to_port(device, entries)
+
+
+def publish_mac_to_port(device, entries):
+    """
+    Stores a new generation of MACtoPort entries for a device, and then makes it the generation that is served.
+
+    The entries are written first, which searches ignore as they only use the generation set on the device. Changing
+    the device's generation is a single UPDATE, so searches switch from the complete old table to the complete new one
+    at once. The old generations are then deleted.
+    """
+    # Microseconds since the epoch, so a later refresh always has a higher generation, even in another process.
+    generation = int(time.time() * 1000000)
+
+    for entry in entries:
+        entry.generation = generation
+
+    with transaction.atomic():
+        MACtoPort.objects.bulk_create(entries)
+
+    # Never replace a generation published by a refresh that started after this one
+    Device.objects.filter(id=device.id, mac_to_port_generation__lt=generation).update(
+        mac_to_port_generation=generation, mac_to_port_updated=int(time.time()))
+
+    # Garbage collect anything older than the generation now being served, including any left behind by a refresh
+    # that lost to a newer one.
+    current = Device.objects.filter(id=device.id).values_list('mac_to_port_generation', flat=True).first()
+    MACtoPort.objects.filter(device=device, generation__lt=current).delete()
+
+
+def skipped_devices(device_list, refreshed):
+    """
+    Returns the devices in the list (other than the core switch, which is never refreshed) that weren't refreshed,
+    because they were offline, being backed off from, or failed part way through.
+    """
+    return [device for device in device_list
+            if device.ipv4_address != CORE_SWITCH_IPV4 and device not in refreshed]
+
+
+def update_ignored_ports(device_list, progress=None):
     """
     Adds entries to the IgnoredPort model of uplink and downlink ports on a switch, using the LLDP information.
 
     The LLDP output will tell us, via the OIDs, which ports on a switch are uplink or downlink ports. These are the
     ones we want to ignore when searching, as they will likely have a MAC address table containing every device in the
     school! This isn't very useful as it will show every uplink/downlink port being the location of the device.
+
+    A switch that can't be contacted doesn't stop the others being refreshed. Returns a list of the switches that
+    weren't refreshed. If progress is given, progress(device) is called as each switch is finished with.
+    """
+
+    # Store the LLDP output of each device as soon as it has been got
+    def store(device, lldp_output, error):
+        if error is None:
+            store_ignored_ports(device, lldp_output)
+
+        if progress is not None:
+            progress(device)
+
+    # Get the LLDP output via SNMP from every device that is online, and isn't the core switch, at the same time.
+    lldp_tables, failed = walk_many(reachable_devices(device_list, progress), "1.0.8802.1.1.2.1.4.1.1.4", store)
+
+    return skipped_devices(device_list, lldp_tables)
+
+
+def refresh_search_cache(device_list, progress=None):
+    """
+    Refreshes the ignored ports of the devices in the list whose ignored ports have expired, and then the MAC address
+    -> port entries of those whose entries have expired, ready for a search. Returns a list of the devices (other than
+    the core switch) that still haven't been refreshed.
+
+    However many searches are made at the same time, in however many processes, only one of each refresh runs at a
+    time. The other searches wait (for up to REFRESH_LOCK_WAIT seconds) for it to finish, and then use whatever has
+    been stored, which is the previous results of any device the refresh hasn't got to.
+
+    If progress is given, progress(device) is called as each device is finished with by each refresh run here.
     """
+    # The core switch is never refreshed, so it doesn't count as having expired
+    switches = device_list.exclude(ipv4_address=CORE_SWITCH_IPV4)
+
+    def ignored_ports_expired():
+        return switches.filter(ignored_port_updated__lte=int(time.time()) - IGNORED_PORT_MAX_AGE)
+
+    def mac_to_port_expired():
+        return switches.filter(mac_to_port_updated__lte=int(time.time()) - MAC_TO_PORT_MAX_AGE)
+
+    def refresh(update, expired):
+        # Which devices have expired is worked out again once the refresh is running, so a refresh that has just been
+        # run by another search isn't repeated. The lease is renewed as each device is finished with.
+        def run(renew):
+            def device_done(device):
+                renew()
+
+                if progress is not None:
+                    progress(device)
+
+            update(expired(), device_done)
 
-    # Iterate over every device in the device list
-    for device in device_list:
-        # Check that it is online, and isn't the core switch
-        if device.online is True and device.ipv4_address != "10.49.84.1":
+        return run
 
-            # Establish an SNMP session
-            session = setup_snmp_session(device.ipv4_address)
+    # The lease of a refresh is only taken out when there is something to refresh, so that the usual search (when
+    # nothing has expired) doesn't write to the database.
+    if ignored_ports_expired().exists():
+        single_flight('ignored-ports', refresh(update_ignored_ports, ignored_ports_expired), REFRESH_LOCK_WAIT)
 
-            # Get a list of the LLDP output via SNMP.
-            lldp_output = session.walk("1.0.8802.1.1.2.1.4.1.1.4")
+    if mac_to_port_expired().exists():
+        single_flight('mac-to-port', refresh(update_mac_to_port, mac_to_port_expired), REFRESH_LOCK_WAIT)
 
-            # Iterate over the elements in the LLDP output
-            for i in lldp_output:
-                # The whole OID is returned. Becuase we only want the port, which is actually a part of the OID itself, we need to
-                # remove all the preceeding parts of the OID. We also need to remove the last 2
-                # characters as they are integers incrementing per port.
-                # This check makes sure that the port we are using isn't already in the ports to ignore,
-                # and the OID is actually a port.
-                if (i.oid.replace("iso.0.8802.1.1.2.1.4.1.1.4.0.", "")[:-2] not in port_ignore_list(device)) and (i.oid.replace("iso.0.8802.1.1.2.1.4.1.1.4.0.", "")[:-2] != ""):
-                    # Add a new entry to the database containing the device and ignored port relationship, for this port.
-                    entry = IgnoredPort(device=device, port=i.oid.replace("iso.0.8802.1.1.2.1.4.1.1.4.0.", "")[:-2])
-                    entry.save()
+    now = int(time.time())
+
+    return list(switches.filter(Q(ignored_port_updated__lte=now - IGNORED_PORT_MAX_AGE) |
+                                Q(mac_to_port_updated__lte=now - MAC_TO_PORT_MAX_AGE)))
 
 
 def decimal_to_mac(input):
     """
     Converts the decimal representation of a MAC address used in an SNMP OID to the hexadecimal one most widely used.
     """
-    input = input.replace("mib-2.17.4.3.1.2.", "")  # Replace the identifier part of the OID
-    octets = input.split(".")  # Split up at the . denominator for each octet
+    octets = input.split(".")[-6:]  # Split up at the . denominator for each octet, the MAC address is the last 6
     octets_hex = []
     for octet in octets:
-        octets_hex.append(format(int(octet), "x"))  # Add the hexadecimal representation of each octet to a list
+        # Add the two digit hexadecimal representation of each octet to a list. Without the zero padding, an octet
+        # below 16 would lose a digit.
+        octets_hex.append(format(int(octet), "02x"))
 
     mac_address = ''.join(octets_hex)  # Convert this list into a single string
 
     return mac_address
 
 
-def update_mac_to_port(device_list):
+def locate_mac(mac_address, device_list):
+    """
+    Finds which switch and port a single MAC address (as an integer) is connected to without walking any MAC address
+    tables.
+
+    The port a MAC address has been learned on can be got directly with an SNMP GET of dot1dTpFdbPort followed by the
+    MAC address in decimal form. This is sent to every online switch (other than the core switch) at the same time,
+    so the answer takes about one round trip, rather than the time needed to walk every switch.
+
+    The cached MACtoPort entries of this MAC address are replaced for every switch that answered, and the first entry
+    that isn't on an ignored (uplink/downlink) port is returned, or None if the MAC address wasn't found.
+    """
+    oid = ".1.3.6.1.2.1.17.4.3.1.2." + int_to_decimal(mac_address)
+
+    def fetch(device):
+        with device_session(device) as session:
+            return session.get(oid)
+
+    device_list = [device for device in device_list
+                   if device.online is True and device.ipv4_address != CORE_SWITCH_IPV4]
+
+    results, failed = collect(device_list, fetch)
+
+    # Switches that haven't learned the MAC address answer with noSuchInstance rather than a port
+    ports = dict((device, int(item.value)) for device, item in results.items()
+                 if item.snmp_type not in ('NOSUCHINSTANCE', 'NOSUCHOBJECT'))
+
+    # Get the ignored ports of every switch that has learned the MAC address in a single query
+    ignored = set(IgnoredPort.objects.filter(device__in=list(ports)).values_list('device_id', 'port'))
+
+    with transaction.atomic():
+        # The entries are added to the generation currently being served for each switch, so they can be found
+        # straight away.
+        generations = dict(Device.objects.filter(id__in=[device.id for device in ports]).values_list(
+            'id', 'mac_to_port_generation'))
+
+        entries = [MACtoPort(device=device, mac_address=mac_address, port=port, generation=generations[device.id])
+                   for device, port in ports.items() if (device.id, port) not in ignored]
+
+        # Every switch that answered has told us where the MAC address is now (if anywhere), so any older entries
+        # for it on those switches are out of date.
+        MACtoPort.objects.filter(device__in=list(results), mac_address=mac_address).delete()
+        MACtoPort.objects.bulk_create(entries)
+
+    if entries:
+        return entries[0]
+
+    return None
+
+
+def update_mac_to_port(device_list, progress=None):
     """
     Adds entries to the MACtoPort model with a MAC address -> Port relationship, including the device which the port
     belongs to.
@@ -157,27 +838,23 @@ def update_mac_to_port(device_list):
 
     This iterates through every OID in the list, and checks that the value (port) is not in the port ignore list -
     if not, it adds an entry with the hexadecimal represenation of the MAC address and the port it belongs to.
-    """
-
-    # Iterate over the device list
-    for device in device_list:
-        # Make sure the device isn't the core switch and is online
-        if device.ipv4_address != "10.49.84.1" and device.online is True:
 
-            # Establish an SNMP session with the device
-            session = setup_snmp_session(device.ipv4_address)
+    A switch that can't be contacted doesn't stop the others being refreshed. Returns a list of the switches that
+    weren't refreshed. If progress is given, progress(device) is called as each switch is finished with.
+    """
 
-            # OID for dot1dTpFdbPort (Port table)
-            # http://oid-info.com/get/1.3.6.1.2.1.17.4.3.1.2
-            port_address_table = session.walk(".1.3.6.1.2.1.17.4.3.1.2")
+    # Store the port table of each device as soon as it has been got, so it can be searched straight away
+    def store(device, port_address_table, error):
+        if error is None:
+            store_mac_to_port(device, port_address_table)
 
-            for item in port_address_table:
-                # item.oid contains the MAC address and item.value is the name of the port itself
+        if progress is not None:
+            progress(device)
 
-                # Check that the port is not in our ignore list
-                if int(item.value) not in port_ignore_list(device):
-                    # Convert the decimal MAC to a hexadecimal representation, which is widely used,
-                    # and add a new object with this information.
-                    entry = MACtoPort(device=device, mac_address=decimal_to_mac(item.oid), port=item.value)
-                    entry.save()
+    # OID for dot1dTpFdbPort (Port table), walked on every device that isn't the core switch and is online at the
+    # same time.
+    # http://oid-info.com/get/1.3.6.1.2.1.17.4.3.1.2
+    port_address_tables, failed = walk_many(reachable_devices(device_list, progress), ".1.3.6.1.2.1.17.4.3.1.2",
+                                            store)
 
+    return skipped_devices(device_list, port_address_tables)
@@ -1,17 +1,38 @@
 from django.shortcuts import render, Http404, HttpResponse, HttpResponseRedirect
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponseNotModified
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 #import matplotlib.pyplot as plt
 import pygal
 import pygal.style
 import io
 from .utils import *
 from .forms import NewDeviceForm, RemoveDeviceForm, EditDeviceForm
-from .models import Device, LastUpdated, MACtoPort, IgnoredPort
+from .models import Device, MACtoPort, LogEntry, SearchJob
+from .jobs import start_search, check_lost
+from .export import export_rows, csv_lines, ndjson_lines
+from .events import status_stream
+from .macaddr import mac_to_int
+from .snmpcache import cached_snmp
+from .db import batches
 from django.core.urlresolvers import reverse
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Case, Count, IntegerField, Max, When
 from easysnmp import exceptions
+import datetime
+import json
 import socket
 import time
 
+from netstatus.settings import DEVICE_INFO_CACHE_TTL, DEVICE_INFO_MAX_STALE, LOG_ENTRIES_PER_PAGE, \
+    SEARCH_BATCH_MAX_SIZE, TIMESERIES_ROLLUPS
+
+# Rollup name -> how far back (in seconds) a traffic chart of that rollup goes
+TRAFFIC_CHART_PERIODS = {'5min': 86400, 'hour': 7 * 86400, 'day': 31 * 86400}
+
 
 def main(request):
     """
@@ -28,26 +49,61 @@ def piechart_online(request):
     """
     Generates a pie chart based on the number of online/offline devices on the network (those tracked by NetStatus).
     Returns an SVG image of the chart (which is never stored on disk - only in memory).
+
+    The online state of each device is kept up to date by the poll_devices management command, so this only needs a
+    single aggregate query and never has to contact the devices themselves.
+
+    The chart only changes when the number of online and offline devices, or the last time a device changed state,
+    does, so the rendered chart is cached by those, and they are sent as the ETag (and Last-Modified) of the chart.
+    A browser that already has the current chart (eg. a wall display refreshing the dashboard) gets a 304 response.
     """
 
-    # Queries the database to get all the device rows
-    devlist = Device.objects.all()
+    # Counts the online devices and the total number of devices, and finds the last state change, in one query
+    status = Device.objects.aggregate(online=Count(Case(When(online=True, then=1), output_field=IntegerField())),
+                                      total=Count('id'), version=Max('status_changed'))
 
-    online = 0
-    offline = 0
+    online = status['online']
+    offline = status['total'] - online
+    version = status['version'] or 0
 
-    # Checks if every device in the list is online or offline by using the 'ping' funtion. A total of online/offline
-    # devices is created and each individual device's status is updated in the database.
-    for device in devlist:
-        if ping(device.ipv4_address):
-            online = online + 1
-            device.online = True
-            device.save()
-        else:
-            offline = offline + 1
-            device.online = False
-            device.save()
+    etag = '"{0}-{1}-{2}"'.format(online, offline, version)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+
+    if if_none_match:
+        # The ETag takes precedence, as a device being removed changes the counts but not the last state change
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(",")]
+    else:
+        not_modified = if_modified_since is not None and 0 < version <= if_modified_since
+
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        key = "piechart-online:{0}:{1}:{2}".format(online, offline, version)
+        svg = cache.get(key)
+
+        if svg is None:
+            svg = render_piechart_online(online, offline)
+            cache.set(key, svg, 86400)
+
+        response = HttpResponse(svg, content_type='image/svg+xml')
+
+    response['ETag'] = etag
+
+    if version:
+        response['Last-Modified'] = http_date(version)
+
+    # Browsers have to check whether the chart has changed every time, which only costs them a 304 if it hasn't
+    response['Cache-Control'] = 'no-cache'
+
+    return response
 
+
+def render_piechart_online(online, offline):
+    """
+    Renders the online/offline pie chart as SVG.
+    """
     custom_style = pygal.style.Style(
         background='transparent',
         colors=("#006600", "#ff0000") # Colours (red and green) for the offline/online status
@@ -55,7 +111,7 @@ def piechart_online(request):
 
     pie_chart = pygal.Pie(style=custom_style, human_readable=True, print_values=True)
 
-    pie_chart.title = "Number of online and offline devices on page load"
+    pie_chart.title = "Number of online and offline devices at the last poll"
 
     pie_chart.add("Online devices", online)
     pie_chart.add("Offline devices", offline)
@@ -64,13 +120,76 @@ def piechart_online(request):
 
     # Returns a SVG image only - not a web page
     # The browser and user wouldn't know this is dynamically generated.
-    return pie_chart.render_django_response()
+    return pie_chart.render()
+
+
+def device_traffic(request, id, port):
+    """
+    Generates a line chart of the traffic in and out of a port of a device (by its ifIndex), averaged over each bucket
+    of a rollup (?resolution=, one of the names in TIMESERIES_ROLLUPS, an hour by default), along with the 95th
+    percentile of each bucket. Returns an SVG image of the chart.
+
+    The chart is drawn from the rollups kept up to date by the poll_devices management command, so however long a
+    period it covers, only one value per bucket is read.
+    """
+    resolution = request.GET.get('resolution', 'hour')
+
+    if resolution not in TRAFFIC_CHART_PERIODS:
+        raise Http404
+
+    try:
+        # Only imported here, as reading the rollups needs NumPy, which the rest of the site doesn't
+        from .timeseries import open_store
+        from .rollups import open_rollup, STATISTICS
+    except ImportError:
+        raise Http404
+
+    try:
+        device = Device.objects.get(pk=id)
+        store = open_store(device.id, readonly=True)
+        column = store.ports.index(int(port))
+        rollup = open_rollup(device.id, resolution, store.max_ports, readonly=True)
+    except (ObjectDoesNotExist, ValueError, IOError):
+        # No such device, no traffic recorded for the device or no such port
+        raise Http404
+
+    now = int(time.time())
+    starts, statistics = rollup.read(now - TRAFFIC_CHART_PERIODS[resolution], now)
+
+    custom_style = pygal.style.Style(
+        background='transparent',
+        colors=("#0066cc", "#99c2ff", "#006600", "#99cc99")
+    )
+
+    line_chart = pygal.DateTimeLine(style=custom_style, show_dots=False, x_label_rotation=30,
+                                    x_value_formatter=lambda value: value.strftime('%d/%m %H:%M'),
+                                    value_formatter=lambda value: "{0:.1f} Mbit/s".format(value))
+
+    line_chart.title = "Traffic on port {0} of {1}".format(port, device.name)
+
+    avg, p95 = STATISTICS.index('avg'), STATISTICS.index('p95')
+    times = [datetime.datetime.fromtimestamp(start) for start in starts.tolist()]
+
+    for counter, label in ((0, "In"), (1, "Out")):
+        for statistic, name in ((avg, "average"), (p95, "95th percentile")):
+            # Octets per second to megabits per second, with buckets that have no rate left as gaps
+            values = statistics[:, column, counter, statistic] * 8 / 1000000
+
+            line_chart.add("{0} ({1})".format(label, name),
+                           [(time_, None if value != value else value) for time_, value in zip(times, values.tolist())])
+
+    response = HttpResponse(line_chart.render(), content_type='image/svg+xml')
+
+    # The chart only changes once every bucket
+    response['Cache-Control'] = 'max-age={0}'.format(min(rollup.seconds, 300))
+
+    return response
 
 
 def device_list(request):
     """
     Returns a list of SNMP enabled devices in the school. These will most likely be switches.
-    Gets data from backend database.
+    Gets data from backend database. The online state shown is the one stored by the poll_devices management command.
     """
 
     set_of_devices = Device.objects.all()
@@ -80,6 +199,28 @@ def device_list(request):
     return render(request, 'base_device_list.html', pagevars)
 
 
+def device_status(request):
+    """
+    Streams the devices going online and offline to the device list's map as Server-Sent Events (see events.py), so the
+    map can update each device's icon as it happens rather than the whole page being reloaded.
+
+    A browser that reconnects sends the ID of the last event it got (Last-Event-ID), and carries on from there.
+    """
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID')
+
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(status_stream(last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the events
+    response['X-Accel-Buffering'] = 'no'
+
+    return response
+
+
 def device_new(request):
     """
     A page for creating a new entry in the database for a new device, gets the user submitted values from the form.
@@ -106,16 +247,15 @@ def device_new(request):
                                                                 'form': form.as_p()})
 
             # Connect to SNMP agent, which we already know is online, so don't need to check status again.
-            session = setup_snmp_session(form.cleaned_data['ipv4_address'])
-
-            description = session.get('sysDescr')
+            with snmp_session(form.cleaned_data['ipv4_address']) as session:
+                description = session.get('sysDescr')
 
             online = True  # We know this because we just 'pinged' the device
 
             # Create Device object with information the user submitted
             device = Device(name=form.cleaned_data['name'], ipv4_address=form.cleaned_data['ipv4_address'],
                             location_x=form.cleaned_data['location_x'], location_y=form.cleaned_data['location_y'],
-                            online=online, system_version=description)
+                            online=online, system_version=description, status_changed=int(time.time()))
 
             # Add the entry to the database
             device.save()
@@ -232,7 +372,7 @@ def device_edit_snmp(request, id):
 
     # Check the device is online before getting or changing attributes - this is important as we are editing SNMP
     # attributes, which are stored directly on the device.
-    if not ping(device.ipv4_address):
+    if not ping(device.ipv4_address, device.snmp_timeout, device.snmp_retries):
         # If its not online, then we won't be able to get and therefore change these attributes
         pagevars = {'title': 'Connection to device failed', 'info': 'Error, connection to the device specified failed. '
                                                                     'The device may be offline, or not accepting SNMP '
@@ -248,15 +388,14 @@ def device_edit_snmp(request, id):
         sysLocation = request.POST.get('sysLocation')
         sysContact = request.POST.get('sysContact')
 
-        # Establish SNMP session with device
-        session = setup_snmp_session(device.ipv4_address)
-
         # Set device SNMP variables to user input values
         # .0 is required here to edit the element
         try:
-            session.set("sysName.0", sysName)
-            session.set("sysLocation.0", sysLocation)
-            session.set("sysContact.0", sysContact)
+            # Establish SNMP session with device
+            with device_session(device) as session:
+                session.set("sysName.0", sysName)
+                session.set("sysLocation.0", sysLocation)
+                session.set("sysContact.0", sysContact)
         except (exceptions.EasySNMPTimeoutError, exceptions.EasySNMPError):
             # For some reason the EasySNMP library returns a timeout error when it cannot set attributes for certain
             # models of switches. (HP 1910-16G). The EasySNMPError exception covers noAccess (permission denied to edit)
@@ -271,12 +410,11 @@ def device_edit_snmp(request, id):
         return HttpResponseRedirect(reverse('device-edit-success'))
 
     # Establish SNMP session with device
-    session = setup_snmp_session(device.ipv4_address)
-
-    # Get the system attributes we want the user to be able to edit from the device
-    sysName = session.get("sysName.0")
-    sysLocation = session.get("sysLocation.0")
-    sysContact = session.get("sysContact.0")
+    with device_session(device) as session:
+        # Get the system attributes we want the user to be able to edit from the device
+        sysName = session.get("sysName.0")
+        sysLocation = session.get("sysLocation.0")
+        sysContact = session.get("sysContact.0")
 
     # Output the page to the user, with the following information sent to the page template
     pagevars = {'title': "NetStatus Edit Device", 'device': device, 'sysName': sysName, 'sysLocation': sysLocation,
@@ -296,6 +434,14 @@ def device_info(request, id):
     """
     Page for getting information via SNMP from a device, and outputting it to the user. Gets system based attributes
     and logging information.
+
+    The information is cached for DEVICE_INFO_CACHE_TTL seconds, and after that is still shown (for up to
+    DEVICE_INFO_MAX_STALE seconds more) while it is refreshed in the background. Adding ?refresh=1 to the URL gets the
+    information from the device straight away.
+
+    The device's log entries are stored in the database whenever the information is got from the device, and the
+    stored entries are shown a page at a time (?page=), only showing warnings unless another severity is asked for
+    (?severity=, or ?severity=all for every entry).
     """
     # Checks that the requested ID does actually belong to a device
     try:
@@ -307,45 +453,55 @@ def device_info(request, id):
         # Text in an int only field
         raise Http404
 
-    # Make sure device is online before trying to get any information from it
-    if not ping(device.ipv4_address):
+    try:
+        # Get the system items and log items from the cache, or from the device if they aren't cached (or the user
+        # asked for them to be refreshed). A device that is offline or not accepting SNMP requests times out, one
+        # whose address can't be reached at all can't be connected to, and one that won't give us its information
+        # returns an SNMP error.
+        system_information, fetched = cached_snmp("device-info:{0}".format(device.id),
+                                                  lambda: device_information(device),
+                                                  DEVICE_INFO_CACHE_TTL, DEVICE_INFO_MAX_STALE,
+                                                  force=request.GET.get('refresh') == '1')
+    except exceptions.EasySNMPError:
         pagevars = {'title': 'Connection to device failed', 'info': 'Error, connection to the device specified failed. '
                                                                     'The device may be offline, or not accepting SNMP '
                                                                     'requests.'}
         return render(request, "base_error.html", pagevars)
 
-    # Establish SNMP session with the device
-    session = setup_snmp_session(device.ipv4_address)
+    age = int(time.time() - fetched)
+
+    # Only items that are classed as warnings are shown to the user by default. Informational alerts are less useful
+    # eg. show when a port has been connected and disconnected.
+    severity = request.GET.get('severity', 'W')
 
-    # Get a list of system items from the device
-    system_items = session.walk('system')
+    log_entries = LogEntry.objects.filter(device=device).order_by('-id')
 
-    system_information = {}
+    if severity != 'all':
+        log_entries = log_entries.filter(severity=severity[:1])
 
-    # Iterate over this list and put the items in a dictionary with OID -> OID Value (the rest of the information has
-    # little use to us)
-    for i in system_items:
-        if i.oid != 'sysUpTimeInstance':
-            system_information[i.oid] = i.value
-        else:
-            # Convert the timeticks value of this OID to days so its easier for the user to read
-            system_information[i.oid] = int(timeticks_to_days(int(i.value)))
+    paginator = Paginator(log_entries.values_list('description', flat=True), LOG_ENTRIES_PER_PAGE)
 
-    # Get a list of log items from the device
-    log_items = session.walk('mib-2.16.9.2.1.4')
+    # The ports that traffic has been recorded for, for the traffic charts. Reading them needs NumPy, so it is only
+    # imported here, and without it (or a store that can be read) there are no charts.
+    try:
+        from .timeseries import open_store
 
-    log_items_strings = []
+        ports = open_store(device.id, readonly=True).ports
+    except (ImportError, IOError, ValueError):
+        ports = []
 
-    # Iterate over this list
-    for item in log_items:
-        # This means that only items that are classed as warnings will be shown to the user.
-        # Informational alerts are less useful eg. show when a port has been connected and disconnected.
-        if item.value.startswith('W'):
-            log_items_strings.append(item.value)
+    try:
+        log_page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        log_page = paginator.page(1)
+    except EmptyPage:
+        log_page = paginator.page(paginator.num_pages)
 
     # Output the page to the user with the following attributes sent to the template
     pagevars = {'title': "NetStatus for " + device.name, 'system_information': system_information,
-                'log_items_strings': log_items_strings, 'device': device}
+                'log_page': log_page, 'severity': severity, 'device': device,
+                'age': age, 'stale': age > DEVICE_INFO_CACHE_TTL, 'ports': ports,
+                'rollups': [name for name, seconds, slots in TIMESERIES_ROLLUPS]}
 
     return render(request, "base_device_info.html", pagevars)
 
@@ -355,36 +511,25 @@ def search(request):
     Lets the user search for a device on the whole network, assuming it is connected to one of the switches tracked
     by NetStatus.
 
-    First gets the MAC address of the device to find, and then gets the LLDP port tables (to get a list of ports to
-    ignore), MAC address tables and port tables from all of the switches on the system.
-    Checks the MAC address against the filtered MAC address tables to see where on the network the device is.
+    First gets the MAC address of the device to find, and then starts a search job in the background (see jobs.py),
+    which gets the LLDP port tables (to get a list of ports to ignore), MAC address tables and port tables from all of
+    the switches on the system, and checks the MAC address against the filtered MAC address tables to see where on the
+    network the device is. The user is sent to the search_job page, which shows the progress and then the result.
     """
 
     # If the user submits the form...
     if request.method == "POST":
-        # Get the (hopefully) IPv4 address the user entered
-        user_input = request.POST.get('ipv4_address')
+        # Get the (hopefully) IPv4 or MAC address the user entered
+        user_input = request.POST.get('ipv4_address', '')
 
         # If the user has requested to delete the cached objects
         if 'delcache' in request.POST:
             # The user has requested that we delete all cached items
-            try:
-                # Get first row of the LastUpdated model
-                last_updated = LastUpdated.objects.get(pk=1)
-                # Setting the time stamps to 0 will force the system to regrab any results as 0 indicates that the
-                # last updated time was Thurs 1st Jan 1970 at 00:00:00 GMT.
-                last_updated.ignored_port = 0
-                last_updated.mac_to_port = 0
-                # Update database entry
-                last_updated.save()
-            except:
-                # This is in case the user clicks 'Delete cache' before any searches have even been made!
-                # Initialises the first object in the LastUpdated table
-                last_updated = LastUpdated(mac_to_port=0, ignored_port=0)
-                last_updated.save()
-            # Delete all the objects in the IgnoredPort and MACtoPort models
-            IgnoredPort.objects.all().delete()
-            MACtoPort.objects.all().delete()
+            # Setting the time stamps to 0 will force the system to regrab any results as 0 indicates that the
+            # last updated time was Thurs 1st Jan 1970 at 00:00:00 GMT.
+            # The cached objects themselves are kept and searched until they have been replaced, so that a search
+            # made before then doesn't find an empty table.
+            Device.objects.update(mac_to_port_updated=0, ignored_port_updated=0)
 
             # Output page with message telling user the cache was cleared
             pagevars = {'title': "Search for a device", 'message': "Cache cleared successfully!"}
@@ -393,35 +538,32 @@ def search(request):
 
 
         try:
-            # Tries to establish a socket with the IP address the user provided. Will error if the address is not
-            # correct/valid etc.
-            socket.inet_aton(user_input)
-        except socket.error:
-            pagevars = {'title': "Search for a device", 'message': "Error: The IPv4 address you specified was not "
-                                                                   "valid!"}
-
-            return render(request, "base_search.html", pagevars)
-
-        # Call the get_mac_address function in utils.py to get the MAC address of the IP address the user provided.
-        mac_to_find = get_mac_address(user_input)
+            # The user can also search using the MAC address of the device, written in any of the usual ways, in which
+            # case it doesn't need to be looked up. MAC addresses are stored as integers in the database.
+            mac_to_find = mac_to_int(user_input)
+        except ValueError:
+            try:
+                # Tries to establish a socket with the IP address the user provided. Will error if the address is not
+                # correct/valid etc.
+                socket.inet_aton(user_input)
+            except socket.error:
+                pagevars = {'title': "Search for a device", 'message': "Error: The IPv4 or MAC address you specified "
+                                                                       "was not valid!"}
 
-        # ERR_PING_FAIL returned when get_mac_address cannot ping the specified device
-        if mac_to_find == "ERR_PING_FAIL":
-            pagevars = {'title': "Search for a device", 'message': "Error: The system could not ping the device you "
-                                                                "specified! The device firewall may be "
-                                                                "preventing this."}
+                return render(request, "base_search.html", pagevars)
 
-            return render(request, "base_search.html", pagevars)
+            # Call the get_mac_address function in utils.py to get the MAC address of the IP address the user provided.
+            mac_address = get_mac_address(user_input)
 
-        # get_mac_address either didn't get a MAC address at all, or the one it did get wasn't the correct number of
-        # characters
-        if mac_to_find == "ERR_ARP_FAIL" or mac_to_find == "ERR_MALFORMED_MAC":
-            pagevars = {'title': "Search for a device", 'message': "Error: The system could not get the MAC address of "
-                                                                "the device you specified."}
+            # get_mac_address returns ERR_ARP_FAIL when neither the routers nor this server know the MAC address of
+            # the device
+            if mac_address == "ERR_ARP_FAIL":
+                pagevars = {'title': "Search for a device", 'message': "Error: The system could not get the MAC "
+                                                                       "address of the device you specified."}
 
-            return render(request, "base_search.html", pagevars)
+                return render(request, "base_search.html", pagevars)
 
-        device_list = Device.objects.all()
+            mac_to_find = mac_to_int(mac_address)
 
         # To speed things up, the search system will generally used cached results in the database.
         # The ignored ports will only be rechecked if a week has passed, as these are likely to rarely change.
@@ -429,96 +571,179 @@ def search(request):
         # of 1 day has been chosen. The user can always choose to clear the cached results and start a search from
         # scratch if they are having problems finding a correct location.
 
-        # Note: EasySNMPTimeoutError will be thrown when EasySNMP has problems connecting to a switch (even if it is
-        # online)
+        # How old the cached results are is tracked separately for every device, so only the devices whose results
+        # have expired are contacted again, and refreshing a device only replaces that device's results. Devices that
+        # have never been searched have a last updated time of 0, so they are always refreshed.
 
-        # A try statement is used in case this is the first run of the program. In this instance, the LastUpdated object
-        # with PK 1 will not exist yet. If the search function has been run before, then PK 1 will exist so the system
-        # can continue as normal.
-        try:
-            last_updated = LastUpdated.objects.get(pk=1)
-
-            # 604800 seconds = 1 week
-            if int(time.time()) >= last_updated.ignored_port + 604800:
-                last_updated.ignored_port = int(time.time())
-                last_updated.save()
-                # We delete the existing objects every time to 'purge' the cache
-                IgnoredPort.objects.all().delete()
-
-                try:
-                    # Run the update_ignored_ports function in utils.py
-                    update_ignored_ports(device_list)
-                except exceptions.EasySNMPTimeoutError:
-                    # If sonnecting to a switch does fail...
-                    pagevars = {'title': "Search for a device", 'message':
-                        "Error: The system could not contact a switch during the search."}
-
-                    return render(request, "base_search.html", pagevars)
-
-            # 8600 seconds = 1 day
-            if int(time.time()) >= last_updated.mac_to_port + 8600:
-                last_updated.mac_to_port = time.time()
-                last_updated.save()
-                # We delete the existing objects every time to 'purge' the cache
-                MACtoPort.objects.all().delete()
-
-                try:
-                    # Run the update_mac_to_port function in utils.py
-                    update_mac_to_port(device_list)
-                except exceptions.EasySNMPTimeoutError:
-                    # If connecting to a switch does fail...
-                    pagevars = {'title': "Search for a device", 'message':
-                        "Error: The system could not contact a switch during the search."}
-
-                    return render(request, "base_error.html", pagevars)
-
-        except ObjectDoesNotExist:
-            # This is the first run of the searching algorithm, so we need to initialise the PK 1 of LastUpdated
-            last_updated = LastUpdated(mac_to_port=int(time.time()), ignored_port=int(time.time()))
-            last_updated.save()
+        # Refreshing the results can take a long time, so the search is run in the background (see jobs.py) and the
+        # user is sent to a page that shows its progress.
+        job = start_search(mac_to_find)
 
-            try:
-                # Run through the algorithm fully. We don't need to check last updated times as this is the first run.
-                update_ignored_ports(device_list)
-                update_mac_to_port(device_list)
-            except exceptions.EasySNMPTimeoutError:
-                # If connecting to a switch does fail...
-                pagevars = {'title': "Search for a device", 'message':
-                    "Error: The system could not contact a switch during the search."}
+        return HttpResponseRedirect(reverse('search-job', args=[job.id]))
 
-                return render(request, "base_search.html", pagevars)
+    # Output the search page to the user
+    pagevars = {'title': "Search for a device"}
+
+    return render(request, "base_search.html", pagevars)
 
-        # .1.3.6.1.2.1.17.4.3.1.1
 
+def search_job(request, id):
+    """
+    Shows the progress of a search started from the search page, which the page keeps up to date using the
+    search_progress view, and then the result once it has finished.
+    """
+    try:
+        job = check_lost(SearchJob.objects.select_related('device').get(pk=id))
+    except (ObjectDoesNotExist, ValueError):
+        raise Http404
+
+    skipped = job.skipped.split(", ") if job.skipped else []
+
+    if job.state == SearchJob.FAILED:
+        pagevars = {'title': "Search for a device", 'message': "Error: The search failed, please try again."}
+
+        return render(request, "base_search.html", pagevars)
+
+    if job.state != SearchJob.DONE:
+        pagevars = {'title': "Search for a device", 'job': job}
+
+        return render(request, "base_search.html", pagevars)
+
+    if job.device is None:
+        # The MAC address could not be found - so the device could have been added recently, or its on a switch that
+        # we just don't track (eg. behind an IP phone).
+        pagevars = {'title': "Device search returned no results", 'skipped': skipped}
+
+        return render(request, "base_search_noresult.html", pagevars)
+
+    # The job has the port and MAC address of the device, so it is shown in place of the MACtoPort entry
+    pagevars = {'title': "Device search results", 'device': job.device, 'mac_to_port_info': job,
+                'skipped': skipped}
+
+    return render(request, "base_search_result.html", pagevars)
+
+
+def search_progress(request, id):
+    """
+    Returns the progress of a search as JSON: its state, how many of the switches that needed refreshing have been
+    finished with, where the MAC address has been seen so far, and the result once the search is done.
+    """
+    try:
+        job = check_lost(SearchJob.objects.select_related('device').get(pk=id))
+    except (ObjectDoesNotExist, ValueError):
+        raise Http404
+
+    # Entries are stored as soon as each switch has been refreshed, so the MAC address can be seen before the search
+    # has finished
+    hits = [{'device_id': entry.device_id, 'device': entry.device.name, 'port': entry.port}
+            for entry in MACtoPort.objects.current().for_mac(job.mac_address).select_related('device')[:10]]
+
+    result = None
+    if job.state == SearchJob.DONE and job.device is not None:
+        result = {'device_id': job.device_id, 'device': job.device.name, 'port': job.port}
+
+    return JsonResponse({'id': str(job.id), 'state': job.state, 'mac_address': job.mac_address_hex,
+                         'switches_done': min(job.switches_done, job.switches_total),
+                         'switches_total': job.switches_total, 'partial_hits': hits, 'result': result,
+                         'skipped': job.skipped.split(", ") if job.skipped else [], 'error': job.error})
+
+
+@csrf_exempt
+@require_POST
+def search_batch(request):
+    """
+    Finds where many devices are connected in one request, for scripts. The body is a JSON object with 'addresses', a
+    list of IPv4 and/or MAC addresses, and optionally 'refresh': true to refresh any expired search results first
+    (which can take a long time). Otherwise only the stored search results are used.
+
+    The results are streamed back as NDJSON, one JSON object per line for each address in the order they were given,
+    with the MAC address, and the device (switch) and port it was found on, or 'found': false.
+
+    The IPv4 addresses are all resolved to MAC addresses together (see get_mac_addresses), and all of the MAC
+    addresses are looked up on the indexed MACtoPort.mac_address a batch at a time (see batches).
+    """
+    try:
+        body = json.loads(request.body.decode('utf-8'))
+        addresses = body['addresses']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': "The body must be a JSON object with a list of 'addresses'."}, status=400)
+
+    if not isinstance(addresses, list) or not all(isinstance(address, str) for address in addresses):
+        return JsonResponse({'error': "'addresses' must be a list of strings."}, status=400)
+
+    if len(addresses) > SEARCH_BATCH_MAX_SIZE:
+        return JsonResponse({'error': "No more than {0} addresses can be searched for at once.".format(
+            SEARCH_BATCH_MAX_SIZE)}, status=400)
+
+    # Work out which of the addresses are MAC addresses and which are IPv4 addresses
+    macs = {}
+    ips = []
+
+    for address in addresses:
         try:
-            # Get the first result from the database in the MACtoPort table corresponding with the MAC address of the
-            # device the user entered.
-            mac_to_port_info = MACtoPort.objects.all().filter(mac_address__exact=mac_to_find).first()
+            macs[address] = mac_to_int(address)
+        except ValueError:
+            try:
+                socket.inet_aton(address)
+                ips.append(address)
+            except socket.error:
+                pass
 
-            if mac_to_port_info is not None:
-                # Get the corresponding switch attributes from the database, this is so we can tell the user the switch
-                # and which port the device is connected to.
-                device = Device.objects.get(id=mac_to_port_info.device_id)
+    if ips:
+        resolved = get_mac_addresses(ips)
+        macs.update((ip, resolved[ip]) for ip in ips if ip in resolved)
 
-                pagevars = {'title': "Device search results", 'device': device, 'mac_to_port_info': mac_to_port_info}
+    if body.get('refresh') is True:
+        refresh_search_cache(Device.objects.all())
 
-                return render(request, "base_search_result.html", pagevars)
-            else:
-                # Sometimes mac_to_port_info will return None when nothing is found, so this fixes that issue and
-                # tells the user that no results have been found
-                pagevars = {'title': "Device search returned no results"}
+    # Where each MAC address was found, keeping the first entry for a MAC address seen on several switches
+    found = {}
+    mac_list = list(set(macs.values()))
 
-                return render(request, "base_search_noresult.html", pagevars)
+    for batch in batches(mac_list):
+        for entry in MACtoPort.objects.current().filter(mac_address__in=batch).select_related('device').order_by('id'):
+            found.setdefault(entry.mac_address, entry)
 
+    def results():
+        for address in addresses:
+            mac_address = macs.get(address)
+            entry = found.get(mac_address)
 
-        except ObjectDoesNotExist:
-            # The MAC address could not be found in the database - so the device could have been added recently,
-            # or its on a switch that we just don't track (eg. behind an IP phone).
-            pagevars = {'title': "Device search returned no results"}
+            result = {'query': address, 'mac_address': int_to_mac(mac_address) if mac_address is not None else None,
+                      'found': entry is not None}
 
-            return render(request, "base_search_noresult.html", pagevars)
+            if mac_address is None:
+                result['error'] = "Not a valid IPv4 or MAC address, or its MAC address could not be found."
+            elif entry is not None:
+                result.update({'device_id': entry.device_id, 'device': entry.device.name, 'port': entry.port})
 
-    # Output the search page to the user
-    pagevars = {'title': "Search for a device"}
+            yield json.dumps(result) + "\n"
 
-    return render(request, "base_search.html", pagevars)
+    return StreamingHttpResponse(results(), content_type='application/x-ndjson')
+
+
+def export(request, table, format):
+    """
+    Exports the current MAC address -> port entries, the ignored ports, or the devices (joined with the name and IPv4
+    address of the device where there is one) as CSV or NDJSON, streamed a chunk of rows at a time so that exporting
+    millions of rows doesn't use any more memory than exporting a few.
+
+    Rows are in order of their id. ?after= only exports rows with an id greater than the one given and ?limit= stops
+    after that many rows, so a large export can be got in parts, or carried on from the last id got if it was cut short.
+    """
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = int(request.GET['limit']) if 'limit' in request.GET else None
+    except ValueError:
+        return HttpResponse("after and limit must be whole numbers.", status=400, content_type='text/plain')
+
+    rows = export_rows(table, after, limit)
+
+    if format == 'csv':
+        response = StreamingHttpResponse(csv_lines(table, rows), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(ndjson_lines(table, rows), content_type='application/x-ndjson')
+
+    response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(table, format)
+
+    return response
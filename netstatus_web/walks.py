@@ -0,0 +1,120 @@
+from array import array
+import sys
+
+from .macaddr import mac_to_int
+
+
+def full_oids(walk):
+    """
+    Returns the whole OID of every item in a walk. Depending on which MIBs are loaded, EasySNMP either puts the index
+    at the end of item.oid or separately in item.oid_index.
+    """
+    return [item.oid + "." + item.oid_index if getattr(item, 'oid_index', '') else item.oid for item in walk]
+
+
+def parse_fdb_walk(port_address_table):
+    """
+    Turns a walk of dot1dTpFdbPort into two arrays: the MAC addresses as unsigned 64-bit integers, and the ports they
+    were learned on. Item n of both arrays comes from row n of the walk.
+
+    The MAC address is the last 6 parts of each OID, in decimal. Rather than converting each row separately, every OID
+    is joined into one string and split once, the octets are copied into a single buffer with slice assignments, and
+    the whole buffer is then read as big-endian 64-bit integers in one go.
+    """
+    oids = full_oids(port_address_table)
+    ports = array('l', [int(item.value) for item in port_address_table])
+
+    if not oids:
+        return array('Q'), ports
+
+    # A walk normally returns the same OID prefix on every row, so every OID has the same number of parts and the
+    # octets can be picked out with a stride. Fall back to splitting each OID if that isn't the case. Every OID has to
+    # be checked, as OIDs of different lengths could still add up to the expected total and be split in the wrong
+    # places.
+    dots = oids[0].count(".")
+
+    if all(oid.count(".") == dots for oid in oids):
+        length = dots + 1
+        parts = ".".join(oids).split(".")
+        octets = [parts[length - 6 + n::length] for n in range(6)]
+    else:
+        rows = [oid.split(".")[-6:] for oid in oids]
+        octets = [[row[n] for row in rows] for n in range(6)]
+
+    # Each MAC address takes up 8 bytes, with the top 2 left as 0
+    buffer = bytearray(8 * len(oids))
+    for n in range(6):
+        buffer[2 + n::8] = bytes(map(int, octets[n]))
+
+    macs = array('Q', bytes(buffer))
+    if sys.byteorder == 'little':
+        macs.byteswap()
+
+    return macs, ports
+
+
+def parse_lldp_walk(lldp_output):
+    """
+    Returns the set of local ports that have an LLDP neighbour, from a walk of the LLDP remote table.
+
+    The table is indexed by a time mark, the local port number and a neighbour index, so the port is the second to
+    last part of each OID.
+    """
+    return set(int(oid.rsplit(".", 2)[-2]) for oid in full_oids(lldp_output) if oid.count(".") >= 2)
+
+
+def parse_arp_walk(walk, inet_address=False):
+    """
+    Returns a dictionary of IPv4 address -> MAC address (as an integer) from a walk of a router's ARP table.
+
+    ipNetToMediaPhysAddress is indexed by ifIndex and the IPv4 address. Set inet_address for ipNetToPhysicalPhysAddress,
+    which is indexed by ifIndex, the address type, the address length and then the address.
+    """
+    entries = {}
+
+    for oid, item in zip(full_oids(walk), walk):
+        parts = oid.split(".")
+
+        # ipNetToPhysicalTable also holds IPv6 entries, which have an address type of 2 and a length of 16
+        if inet_address and parts[-6:-4] != ["1", "4"]:
+            continue
+
+        # Physical addresses are returned as raw bytes (decoded as latin-1 by EasySNMP), unless the MIB tells EasySNMP
+        # to format them as a string.
+        if len(item.value) == 6:
+            mac_address = int.from_bytes(bytes(item.value, 'latin-1'), 'big')
+        else:
+            try:
+                mac_address = mac_to_int(item.value)
+            except ValueError:
+                continue
+
+        entries[".".join(parts[-4:])] = mac_address
+
+    return entries
+
+
+def log_row_index(item):
+    """
+    Returns the (event index, log index) of an item got from the RMON log description column (mib-2.16.9.2.1.4), or
+    None if the item is past the end of the column, ie. a GETNEXT or GETBULK request has gone on to the next column or
+    table, or the end of the device's MIB view.
+    """
+    if item.snmp_type == 'ENDOFMIBVIEW':
+        return None
+
+    parts = full_oids([item])[0].rsplit(".", 2)
+
+    if len(parts) != 3 or not (parts[0].endswith("16.9.2.1.4") or parts[0].endswith("logDescription")):
+        return None
+
+    return int(parts[1]), int(parts[2])
+
+
+def parse_counter_walk(walk):
+    """
+    Returns a dictionary of ifIndex -> counter value from a walk of a column of the interfaces (ifTable) or interface
+    extensions (ifXTable) table, which are indexed by the ifIndex alone.
+    """
+    return dict((int(oid.rsplit(".", 1)[-1]), int(item.value)) for oid, item in zip(full_oids(walk), walk)
+                if item.value.isdigit())